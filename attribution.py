@@ -0,0 +1,63 @@
+import json
+import time
+import db
+
+ATTRIBUTION_WINDOW = 24 * 3600  # Deliveries not followed by a commit within this long earn nothing
+
+# Delivery status
+PENDING = 0
+CREDITED = 1
+EXPIRED = 2
+
+
+# Log that a pool message went out; `commit_count` is the user's count for `day` at send time
+def record_delivery(chat_id, notification_id, day, commit_count):
+    db.submit(
+        "INSERT INTO deliveries (chat_id, notification_id, sent_at, day, count_at_send) VALUES (?, ?, ?, ?, ?)",
+        (chat_id, notification_id, time.time(), day, commit_count),
+    )
+
+
+# Credit every pending delivery whose user has committed since receiving it.
+# `results` is a list of (chat_id, day, commit_count) from one check cycle. Ratings are
+# bumped with a single UPDATE ... FROM; returns {notification_id: new rating}.
+async def attribute(results, message_pool=None):
+    if not results:
+        return {}
+    cycle = json.dumps([[chat_id, day, commit_count] for chat_id, day, commit_count in results])
+    cycle_results = """
+        WITH cycle AS (
+            SELECT json_extract(value, '$[0]') AS chat_id,
+                   json_extract(value, '$[1]') AS day,
+                   json_extract(value, '$[2]') AS commit_count
+            FROM json_each(?)
+        )
+    """
+    credited = f"""
+        SELECT deliveries.id, deliveries.notification_id FROM deliveries
+        JOIN cycle ON cycle.chat_id = deliveries.chat_id AND cycle.day = deliveries.day
+        WHERE deliveries.status = {PENDING} AND cycle.commit_count > deliveries.count_at_send
+    """
+
+    ratings = db.submit(cycle_results + f"""
+        UPDATE notifications SET rating = rating + credit.increment
+        FROM (SELECT notification_id, COUNT(*) AS increment FROM ({credited}) GROUP BY notification_id) AS credit
+        WHERE notifications.id = credit.notification_id
+        RETURNING notifications.id, notifications.rating
+    """, (cycle,))
+    marked = db.submit(cycle_results + f"""
+        UPDATE deliveries SET status = {CREDITED} WHERE id IN (SELECT id FROM ({credited}))
+    """, (cycle,))
+    expired = db.submit(
+        f"UPDATE deliveries SET status = {EXPIRED} WHERE status = {PENDING} AND sent_at < ?",
+        (time.time() - ATTRIBUTION_WINDOW,),
+    )
+
+    result = await ratings
+    await marked
+    await expired
+    new_ratings = dict(result.rows or [])
+    if message_pool:
+        for notification_id, rating in new_ratings.items():
+            message_pool.set_rating(notification_id, rating)
+    return new_ratings
@@ -0,0 +1,63 @@
+"""
+Per-image CPU cost of the contribution graph renderer.
+
+Compares the old ImageDraw loop (371 rectangles + PNG to disk) with the
+vectorized renderer, both uncached and cached.
+
+    python benchmarks/bench_render.py [iterations]
+"""
+import os
+import sys
+import random
+import tempfile
+import time
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import renderer
+
+
+# The renderer bot.py used before, kept here as the baseline
+def legacy_render(daily_contributions, output_path):
+    box_size, padding = 20, 5
+    cols, rows = 53, 7
+    img_width, img_height = cols * (box_size + padding) + padding, rows * (box_size + padding) + padding
+    image = Image.new("RGB", (img_width, img_height), "white")
+    draw = ImageDraw.Draw(image)
+    colors = ["#ebedf0", "#c6e48b", "#7bc96f", "#239a3b", "#196127"]
+    for i, count in enumerate(daily_contributions):
+        week, day = divmod(i, 7)
+        x = padding + week * (box_size + padding)
+        y = padding + day * (box_size + padding)
+        draw.rectangle([x, y, x + box_size, y + box_size], fill=colors[min(count, len(colors) - 1)])
+    image.save(output_path)
+    with open(output_path, 'rb') as img_file:  # The old send path reopened the file
+        return img_file.read()
+
+
+def measure(label, func, calendars):
+    start_cpu, start_wall = time.process_time(), time.perf_counter()
+    for calendar in calendars:
+        func(calendar)
+    cpu = (time.process_time() - start_cpu) / len(calendars) * 1000
+    wall = (time.perf_counter() - start_wall) / len(calendars) * 1000
+    print(f"{label:<28} {cpu:8.3f} ms CPU/image {wall:8.3f} ms wall/image")
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    random.seed(1)
+    calendars = [[random.choice([0, 0, 0, 1, 2, 3, 5]) for _ in range(371)] for _ in range(iterations)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "graph.png")
+        measure("legacy ImageDraw + disk", lambda calendar: legacy_render(calendar, path), calendars)
+
+    renderer._cache.clear()
+    measure("vectorized (cache miss)", renderer.render_contribution_graph, calendars)
+    measure("vectorized (cache hit)", renderer.render_contribution_graph, calendars)
+    measure("empty graph (cached)", lambda _: renderer.render_empty_contribution_graph(), calendars)
+
+
+if __name__ == "__main__":
+    main()
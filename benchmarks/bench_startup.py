@@ -0,0 +1,111 @@
+"""
+Cold start: time from launching bot.py until it handles its first update.
+
+Each run starts `python bot.py` against a local fake Bot API (see
+bench_updates.py) with a /start update already waiting, on a database seeded
+with --users users whose checks are not yet due, and reports:
+
+  - first poll: the bot's first getUpdates call, i.e. polling has begun
+  - first reply: the bot's answer to the waiting /start reaches the fake API
+
+    python benchmarks/bench_startup.py [--runs 5] [--users 20000]
+"""
+import argparse
+import asyncio
+import os
+import signal
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from tornado.httpserver import HTTPServer
+
+from bench_updates import FakeBotAPI, free_port, start_update
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TOKEN = "123456:startup"
+
+
+class TimedBotAPI(FakeBotAPI):
+    def __init__(self):
+        super().__init__()
+        self.first_poll = None
+
+    async def get_updates(self, params):
+        if self.first_poll is None:
+            self.first_poll = time.perf_counter()
+        return await super().get_updates(params)
+
+
+def seed_database(env, users):
+    subprocess.run([sys.executable, "-c", "import bot; bot.init_database()"], cwd=ROOT, env=env, check=True)
+    conn = sqlite3.connect(env["DATABASE_PATH"])
+    later = time.time() + 3600
+    with conn:
+        conn.executemany(
+            "INSERT INTO users (id, telegram_username, github_username, github_token) VALUES (?, ?, ?, ?)",
+            ((i, f"user{i}", f"user{i}", "token") for i in range(1, users + 1)),
+        )
+        conn.executemany("INSERT INTO schedule (user_id, next_check_at) VALUES (?, ?)", ((i, later) for i in range(1, users + 1)))
+        conn.executemany(
+            "INSERT INTO notifications (category, message) VALUES (?, ?)",
+            ((tier, f"{tier} reminder {n}") for tier in ("gentle", "medium", "harsh") for n in range(20)),
+        )
+    conn.close()
+
+
+async def run_once(env):
+    api = TimedBotAPI()
+    api.expected = 1
+    port = free_port()
+    server = HTTPServer(api.app())
+    server.listen(port, "127.0.0.1")
+    env = dict(env, TELEGRAM_API_URL=f"http://127.0.0.1:{port}/bot")
+
+    started = time.perf_counter()
+    api.queue([start_update(1, 42)])
+    process = subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        await asyncio.wait_for(api.replied.wait(), 60)
+        return api.first_poll - started, api.latencies[0]
+    finally:
+        process.send_signal(signal.SIGINT)
+        try:
+            await asyncio.get_running_loop().run_in_executor(None, process.wait, 15)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        api.new_updates.set()  # Let a pending getUpdates long poll return
+        await asyncio.sleep(0.1)
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--users", type=int, default=20000)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="startup-")
+    env = dict(
+        os.environ,
+        BOT_TOKEN=TOKEN,
+        DATABASE_PATH=os.path.join(workdir, "startup.db"),
+        IMAGE_PATH=workdir,
+        ARCHIVE_GRAPHS="0",
+    )
+    seed_database(env, args.users)
+
+    polls, replies = [], []
+    for _ in range(args.runs):
+        first_poll, first_reply = asyncio.run(run_once(env))
+        polls.append(first_poll)
+        replies.append(first_reply)
+    print(f"{args.runs} runs, {args.users} users: first poll {statistics.median(polls) * 1000:.0f} ms, "
+          f"first reply {statistics.median(replies) * 1000:.0f} ms (medians; best reply {min(replies) * 1000:.0f} ms)")
+
+
+if __name__ == "__main__":
+    main()
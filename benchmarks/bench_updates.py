@@ -0,0 +1,231 @@
+"""
+Command latency and updates/sec for long polling vs the webhook server.
+
+Runs the bot's command handlers against a local fake Bot API: in polling mode
+the fake serves the updates through getUpdates, in webhook mode they are
+POSTed to the bot's webhook server the way Telegram would. Latency is the
+time from handing an update over until the bot's reply reaches the fake API.
+
+    python benchmarks/bench_updates.py [updates] [--mode polling|webhook|both]
+                                       [--rate updates/s] [--recorded updates.jsonl]
+
+Without --rate every update is handed over at once, which measures
+throughput; with it, updates arrive at a steady pace, which measures latency.
+
+Recorded updates are Telegram Update objects, one JSON object per line; by
+default the harness sends /start from distinct chats.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+from collections import defaultdict, deque
+
+import httpx
+from tornado.web import Application as WebApplication, RequestHandler
+from tornado.httpserver import HTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telegram.ext import Application
+import bot
+
+TOKEN = "123456:bench"
+SECRET = "bench-secret"
+WEBHOOK_CONCURRENCY = 40  # Telegram's default max_connections
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_update(update_id, chat_id):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Bench"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+def load_updates(path, count):
+    if not path:
+        return [start_update(i + 1, 1000 + i) for i in range(count)]
+    with open(path) as f:
+        updates = [json.loads(line) for line in f if line.strip()]
+    return (updates * (count // len(updates) + 1))[:count]
+
+
+def chat_of(update):
+    for key in ("message", "edited_message", "channel_post", "callback_query"):
+        if key in update:
+            message = update[key].get("message", update[key])
+            return message["chat"]["id"]
+    return None
+
+
+class FakeBotAPI:
+    """Just enough of the Bot API for the handlers: replies are timed against their update."""
+
+    def __init__(self):
+        self.pending = []  # Updates waiting for getUpdates
+        self.new_updates = asyncio.Event()
+        self.sent_at = defaultdict(deque)  # chat_id -> times its updates were handed over
+        self.latencies = []
+        self.replied = asyncio.Event()
+        self.expected = 0
+
+    def hand_over(self, update):
+        self.sent_at[chat_of(update)].append(time.perf_counter())
+
+    def queue(self, updates):
+        for update in updates:
+            self.hand_over(update)
+        self.pending.extend(updates)
+        self.new_updates.set()
+
+    def reply(self, chat_id):
+        times = self.sent_at.get(chat_id)
+        if times:
+            self.latencies.append(time.perf_counter() - times.popleft())
+        if len(self.latencies) >= self.expected:
+            self.replied.set()
+
+    async def get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        self.pending = [u for u in self.pending if u["update_id"] >= offset]
+        if not self.pending:
+            self.new_updates.clear()
+            try:
+                await asyncio.wait_for(self.new_updates.wait(), float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self.pending[:int(params.get("limit") or 100)]
+
+    def app(self):
+        api = self
+
+        class Handler(RequestHandler):
+            async def post(self, token, method):
+                params = {k: self.get_body_argument(k) for k in self.request.body_arguments}
+                if self.request.headers.get("Content-Type", "").startswith("application/json") and self.request.body:
+                    params = json.loads(self.request.body)
+                if method == "getMe":
+                    result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+                elif method == "getUpdates":
+                    result = await api.get_updates(params)
+                elif method == "sendMessage":
+                    chat_id = int(params["chat_id"])
+                    api.reply(chat_id)
+                    result = {"message_id": 1, "date": int(time.time()), "chat": {"id": chat_id, "type": "private"}, "text": params.get("text", "")}
+                else:  # setWebhook, deleteWebhook, ...
+                    result = True
+                self.write({"ok": True, "result": result})
+
+        return WebApplication([(r"/bot([^/]+)/(\w+)", Handler)])
+
+
+def report(mode, api, elapsed):
+    latencies = sorted(api.latencies)
+    p = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+    print(f"{mode:8} {len(latencies)} updates in {elapsed:.2f} s: {len(latencies) / elapsed:8.1f} updates/s, "
+          f"latency p50 {p(0.5):6.1f} ms  p99 {p(0.99):6.1f} ms  mean {statistics.mean(latencies) * 1000:6.1f} ms")
+
+
+# Hand updates over one by one at `rate` per second, or all at once
+async def offer(updates, rate, hand_over):
+    if not rate:
+        await hand_over(updates)
+        return
+    start = time.perf_counter()
+    for i, update in enumerate(updates):
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await hand_over([update])
+
+
+async def run(mode, updates, rate):
+    api = FakeBotAPI()
+    api.expected = sum(1 for u in updates if chat_of(u) is not None)
+    api_port = free_port()
+    server = HTTPServer(api.app())
+    server.listen(api_port, "127.0.0.1")
+
+    base_url = f"http://127.0.0.1:{api_port}/bot"
+    application = bot.build_application(Application.builder().token(TOKEN).base_url(base_url))
+    await application.initialize()
+    await application.start()
+    try:
+        if mode == "polling":
+            await application.updater.start_polling(poll_interval=0, timeout=10)
+
+            async def hand_over(batch):
+                api.queue(batch)
+
+            start = time.perf_counter()
+            await offer(updates, rate, hand_over)
+            await asyncio.wait_for(api.replied.wait(), 300)
+        else:
+            port = free_port()
+            await application.updater.start_webhook(
+                listen="127.0.0.1", port=port, url_path="telegram",
+                webhook_url=f"http://127.0.0.1:{port}/telegram", secret_token=SECRET,
+            )
+            url = f"http://127.0.0.1:{port}/telegram"
+            limits = httpx.Limits(max_connections=WEBHOOK_CONCURRENCY)
+            async with httpx.AsyncClient(limits=limits) as client:
+                forged = await client.post(url, json=updates[0], headers={"X-Telegram-Bot-Api-Secret-Token": "wrong"})
+                assert forged.status_code == 403, f"update with a wrong secret got {forged.status_code}"
+
+                semaphore = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+
+                async def post(update):
+                    async with semaphore:
+                        api.hand_over(update)
+                        await client.post(url, json=update, headers={"X-Telegram-Bot-Api-Secret-Token": SECRET})
+
+                tasks = []
+
+                async def hand_over(batch):
+                    tasks.extend(asyncio.create_task(post(update)) for update in batch)
+
+                start = time.perf_counter()
+                await offer(updates, rate, hand_over)
+                await asyncio.gather(*tasks)
+                await asyncio.wait_for(api.replied.wait(), 300)
+        report(mode, api, time.perf_counter() - start)
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        api.new_updates.set()  # Let a pending getUpdates long poll return
+        await asyncio.sleep(0.1)
+        server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("updates", nargs="?", type=int, default=2000)
+    parser.add_argument("--mode", choices=["polling", "webhook", "both"], default="both")
+    parser.add_argument("--rate", type=float, help="Updates per second to offer (default: all at once)")
+    parser.add_argument("--recorded", help="JSONL file of recorded Update payloads")
+    args = parser.parse_args()
+
+    updates = load_updates(args.recorded, args.updates)
+    for mode in (["polling", "webhook"] if args.mode == "both" else [args.mode]):
+        asyncio.run(run(mode, updates, args.rate))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Offline load test of the whole bot: registration, checks, rendering and sends.
+
+Everything external is replaced by a local stand-in:
+  - GitHub GraphQL: synthetic contribution calendars, configurable latency and
+    a share of 403/429 rate-limit responses
+  - Telegram Bot API: records every send and answers a share with RetryAfter
+  - MetaAI: a stub that takes --ai-delay seconds per message
+
+The harness registers --users users through the real /github handler, which
+schedules their first check right away, and waits until every user has been
+checked once (or --timeout passes). It reports users checked per minute,
+p50/p99 latency of a check batch, event-loop lag and memory per user.
+
+    python benchmarks/loadtest.py [--users 2000] [--tokens 50] [--github-latency 0.2] ...
+
+Bot settings (SCHEDULER_WORKERS, HTTP_PER_HOST_LIMIT, SEND_GLOBAL_RATE, ...)
+are read from the environment as usual. The bot's own output goes to bot.log
+in the run's temporary directory.
+"""
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--tokens", type=int, default=50, help="Distinct GitHub tokens shared by the users")
+    parser.add_argument("--github-latency", type=float, default=0.2, help="Mean seconds per GraphQL response")
+    parser.add_argument("--rate-limited", type=float, default=0.01, help="Share of GraphQL requests answered 403/429")
+    parser.add_argument("--telegram-latency", type=float, default=0.02, help="Mean seconds per Bot API response")
+    parser.add_argument("--retry-after", type=float, default=0.01, help="Share of sends answered with RetryAfter")
+    parser.add_argument("--ai-delay", type=float, default=1.5, help="Seconds per stub MetaAI message")
+    parser.add_argument("--seed-messages", type=int, default=5, help="Pool messages per tier before the run")
+    parser.add_argument("--timeout", type=float, default=600)
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+WORKDIR = tempfile.mkdtemp(prefix="loadtest-")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+GITHUB_PORT, TELEGRAM_PORT = free_port(), free_port()
+
+# The bot reads its configuration at import time
+os.environ.update({
+    "DATABASE_PATH": os.path.join(WORKDIR, "loadtest.db"),
+    "IMAGE_PATH": WORKDIR,
+    "ARCHIVE_GRAPHS": "0",
+    "GITHUB_GRAPHQL_URL": f"http://127.0.0.1:{GITHUB_PORT}/graphql",
+})
+
+counters = {"graphql": 0, "graphql_limited": 0, "sends": 0, "photos": 0, "retry_after": 0, "ai": 0}
+
+
+class StubMetaAI:
+    def prompt(self, message):
+        time.sleep(ARGS.ai_delay)  # The real client blocks too; the pool runs it on its own thread
+        counters["ai"] += 1
+        return {"message": random.choice(["Keep going, USERNAME!", "USERNAME, one commit today?", "Code now, USERNAME."])}
+
+
+sys.modules["meta_ai_api"] = types.SimpleNamespace(MetaAI=StubMetaAI)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tornado.web import Application as WebApplication, RequestHandler
+from tornado.httpserver import HTTPServer
+from telegram import Update
+from telegram.ext import Application
+import bot
+import db
+import stages
+from config import CONCURRENT_UPDATES
+
+
+def latency(mean):
+    return random.uniform(0.5 * mean, 1.5 * mean)
+
+
+# Deterministic per login and day, about half the users without a commit today
+def synthetic_count(login, day):
+    digest = hashlib.md5(f"{login}:{day}".encode()).digest()
+    return 0 if digest[0] < 128 else digest[1] % 12
+
+
+class GitHubHandler(RequestHandler):
+    async def post(self):
+        await asyncio.sleep(latency(ARGS.github_latency))
+        counters["graphql"] += 1
+        reset = int(time.time()) + 60
+        if random.random() < ARGS.rate_limited:
+            counters["graphql_limited"] += 1
+            if random.random() < 0.5:
+                self.set_status(403)
+                self.set_header("X-RateLimit-Remaining", "0")
+                self.set_header("X-RateLimit-Reset", str(reset))
+            else:
+                self.set_status(429)
+                self.set_header("Retry-After", "1")
+            self.write({"message": "API rate limit exceeded"})
+            return
+
+        payload = json.loads(self.request.body)
+        variables = payload.get("variables") or {}
+        login = variables["login"]
+        today = datetime.now(timezone.utc).date()
+        if "from" in variables:
+            first = datetime.fromisoformat(variables["from"]).date()
+            last = datetime.fromisoformat(variables["to"]).date()
+        else:
+            last = today
+            first = today - timedelta(days=364 + (today.isoweekday() % 7))  # 53 weeks from a Sunday
+        days = [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+        weeks = [days[i:i + 7] for i in range(0, len(days), 7)]
+        self.set_header("X-RateLimit-Limit", "5000")
+        self.set_header("X-RateLimit-Remaining", "4000")
+        self.set_header("X-RateLimit-Reset", str(reset))
+        self.write({"data": {
+            "rateLimit": {"limit": 5000, "remaining": 4000, "resetAt": datetime.fromtimestamp(reset, timezone.utc).isoformat()},
+            "user": {"contributionsCollection": {"contributionCalendar": {"weeks": [
+                {"contributionDays": [{"date": day, "contributionCount": synthetic_count(login, day)} for day in week]}
+                for week in weeks
+            ]}}},
+        }})
+
+
+class TelegramHandler(RequestHandler):
+    async def post(self, token, method):
+        await asyncio.sleep(latency(ARGS.telegram_latency))
+        params = {k: self.get_body_argument(k) for k in self.request.body_arguments}
+        if method == "getMe":
+            self.write({"ok": True, "result": {"id": 1, "is_bot": True, "first_name": "Load", "username": "load_bot"}})
+            return
+        if method not in ("sendMessage", "sendPhoto"):
+            self.write({"ok": True, "result": True})
+            return
+        if random.random() < ARGS.retry_after:
+            counters["retry_after"] += 1
+            self.set_status(429)
+            self.write({"ok": False, "error_code": 429, "description": "Too Many Requests: retry after 1", "parameters": {"retry_after": 1}})
+            return
+
+        chat = {"id": int(params["chat_id"]), "type": "private"}
+        message = {"message_id": counters["sends"] + 1, "date": int(time.time()), "chat": chat}
+        if method == "sendPhoto":
+            counters["photos"] += 1
+            file_id = params.get("photo") or f"photo-{counters['photos']}"  # Uploads get a fresh file_id
+            message["photo"] = [{"file_id": file_id, "file_unique_id": file_id, "width": 1330, "height": 180}]
+        else:
+            message["text"] = params.get("text", "")
+        counters["sends"] += 1
+        self.write({"ok": True, "result": message})
+
+
+# The stand-ins run on their own thread and loop, so they don't show up in the bot's loop lag
+def start_fakes():
+    ready = threading.Event()
+
+    def serve():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        HTTPServer(WebApplication([(r"/graphql", GitHubHandler)])).listen(GITHUB_PORT, "127.0.0.1")
+        HTTPServer(WebApplication([(r"/bot([^/]+)/(\w+)", TelegramHandler)])).listen(TELEGRAM_PORT, "127.0.0.1")
+        loop.call_soon(ready.set)
+        loop.run_forever()
+
+    threading.Thread(target=serve, daemon=True, name="fakes").start()
+    ready.wait()
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+async def sample_loop_lag(lags, interval=0.05):
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+def github_update(i):
+    chat_id = 100000 + i
+    text = f"/github user{i} tok{i % ARGS.tokens}"
+    return {
+        "update_id": i + 1,
+        "message": {
+            "message_id": i + 1,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load", "username": f"load{i}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": 7}],
+        },
+    }
+
+
+def seed_messages():
+    db.execute(
+        "INSERT INTO notifications (category, message) VALUES (?, ?)",
+        [(tier, f"{tier} reminder {n} for {{username}}") for tier in ("gentle", "medium", "harsh") for n in range(ARGS.seed_messages)],
+        many=True,
+    )
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+
+async def run():
+    bot.init_database()
+    seed_messages()
+
+    builder = Application.builder().token("123456:load").base_url(f"http://127.0.0.1:{TELEGRAM_PORT}/bot")
+    application = bot.build_application(builder)
+    await application.initialize()
+    await bot.post_init(application)
+    await application.start()
+
+    # Time every check batch and count the users it covered
+    scheduler = application.bot_data["scheduler"]
+    batch_latencies, checked = [], set()
+    check_batch = scheduler.check_batch
+
+    async def timed_check_batch(chat_ids):
+        started = time.perf_counter()
+        try:
+            return await check_batch(chat_ids)
+        finally:
+            batch_latencies.append(time.perf_counter() - started)
+            checked.update(chat_ids)
+
+    scheduler.check_batch = timed_check_batch
+
+    lags = []
+    lag_task = asyncio.create_task(sample_loop_lag(lags))
+    rss_before = rss_bytes()
+    started = time.perf_counter()
+
+    # Register the way updates arrive: up to CONCURRENT_UPDATES handled at once
+    limit = asyncio.Semaphore(CONCURRENT_UPDATES)
+
+    async def register(i):
+        async with limit:
+            await application.process_update(Update.de_json(github_update(i), application.bot))
+
+    registration = time.perf_counter()
+    await asyncio.gather(*(register(i) for i in range(ARGS.users)))
+    registration = time.perf_counter() - registration
+
+    while len(checked) < ARGS.users and time.perf_counter() - started < ARGS.timeout:
+        await asyncio.sleep(0.2)
+    elapsed = time.perf_counter() - started
+    rss_after = rss_bytes()
+    lag_task.cancel()
+
+    send_queue = application.bot_data["send_queue"]
+    report = [
+        f"users checked:   {len(checked)}/{ARGS.users} in {elapsed:.1f} s ({len(checked) / elapsed * 60:.0f} users/min)",
+        f"registration:    {ARGS.users / registration:.0f} /github commands/s",
+        f"batch latency:   p50 {percentile(batch_latencies, 0.5) * 1000:.0f} ms  p99 {percentile(batch_latencies, 0.99) * 1000:.0f} ms  ({len(batch_latencies)} batches)",
+        f"event-loop lag:  p50 {percentile(lags, 0.5) * 1000:.1f} ms  p99 {percentile(lags, 0.99) * 1000:.1f} ms  max {max(lags, default=0) * 1000:.1f} ms",
+        f"memory:          {(rss_after - rss_before) / max(ARGS.users, 1) / 1024:.1f} KiB/user (RSS {rss_after / 2**20:.0f} MiB)",
+        f"send queue:      {send_queue.stats}, {send_queue.depth()} still queued",
+        f"stages:          {stages.stats()}",
+        f"stand-ins:       {counters}",
+    ]
+
+    await application.stop()
+    await bot.shutdown(application)
+    await application.shutdown()
+    return report
+
+
+def main():
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)  # Rate-limit answers are expected
+    start_fakes()
+    log_path = os.path.join(WORKDIR, "bot.log")
+    with open(log_path, "w") as log, contextlib.redirect_stdout(log):
+        report = asyncio.run(run())
+    print("\n".join(report))
+    print(f"bot output:      {log_path}")
+
+
+if __name__ == "__main__":
+    main()
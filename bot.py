@@ -1,22 +1,38 @@
 import os
-import sqlite3
-import requests
-from datetime import datetime, timedelta
+import importlib
+import random
+import re
+import time
+import secrets
+import signal
+from types import SimpleNamespace
+from datetime import date, datetime
 import asyncio
 from telegram import Update
 from telegram.ext import Application, CommandHandler, CallbackContext
-from dotenv import load_dotenv
-from meta_ai_api import MetaAI
-from PIL import Image, ImageDraw
 import pytz
+from github_fetcher import fetch_calendars
+import http_client
+from rate_budget import budget
+from config import (
+    BOT_TOKEN, TELEGRAM_API_URL, WARMUP_DELAY, IMAGE_PATH, ARCHIVE_GRAPHS, BOT_MODE, CONCURRENT_UPDATES, SHARDS, METRICS_PORT,
+    CHECK_DEFER_DELAY, WEBHOOK_URL, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_MAX_CONNECTIONS,
+)
+import db
+import metrics
+import stages
+from telegram_sender import SendQueue, PRIORITY_URGENT, PRIORITY_NORMAL, PRIORITY_GRAPH, PHOTO_PRUNE_JOB, PHOTO_PRUNE_INTERVAL, prune_photo_cache
+from scheduler import Scheduler
+from message_pool import MessagePool, render_template
+from sampler import FALLBACK_BOUNDS_SQL, FALLBACK_PICK_SQL, fallback_picks
+from leaderboard import Leaderboards, ORDERS, DEFAULT_ORDER
+from attribution import attribute, record_delivery
+from jobs import run_periodic
+import escalation
+from pruning import prune_notifications, PRUNE_JOB, PRUNE_INTERVAL
+from retention import run_sweeper
+from sharding import Outbox, ShardRouter, drain_outbox, take_outbox, poll_wakeups, refresh_pool
 
-# Load environment variables
-load_dotenv()
-
-# Constants
-BOT_TOKEN = os.getenv('BOT_TOKEN')  # Your Telegram Bot Token
-DATABASE_PATH = os.getenv('DATABASE_PATH', './notifications.db')  # Default to './notifications.db' if not provided
-IMAGE_PATH = os.getenv('IMAGE_PATH', './Images')  # Default to './Images' if not 
 # DATABASE_PATH = os.path.join(os.getcwd(), "notifications.db")
 # IMAGE_PATH = os.path.join(os.getcwd(), "Images")
 
@@ -25,16 +41,21 @@ os.makedirs(IMAGE_PATH, exist_ok=True)
 
 # Database initialization
 def init_database():
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = db.get_connection()
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS users (
             id INTEGER PRIMARY KEY,
             telegram_username TEXT NOT NULL,
             github_username TEXT NOT NULL,
-            github_token TEXT NOT NULL
+            github_token TEXT NOT NULL,
+            timezone TEXT NOT NULL DEFAULT 'Asia/Bangkok'
         )
     """)
+    # Databases created before per-user timezones
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(users)")]
+    if "timezone" not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN timezone TEXT NOT NULL DEFAULT 'Asia/Bangkok'")
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS notifications (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -43,243 +64,281 @@ def init_database():
             rating INTEGER DEFAULT 0
         )
     """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notifications_category_rating ON notifications (category, rating)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schedule (
+            user_id INTEGER PRIMARY KEY,
+            next_check_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_schedule_next_check_at ON schedule (next_check_at)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS calendars (
+            github_username TEXT PRIMARY KEY,
+            full_synced_on TEXT,
+            start TEXT,
+            counts BLOB
+        )
+    """)
+    # Per-day rows from before packed calendars; a login missing from `calendars` gets a full refresh
+    cursor.execute("DROP TABLE IF EXISTS contribution_days")
+    cursor.execute("DROP TABLE IF EXISTS calendar_sync")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            notification_id INTEGER NOT NULL,
+            sent_at REAL NOT NULL,
+            day TEXT NOT NULL,
+            count_at_send INTEGER NOT NULL,
+            status INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_pending ON deliveries (status, chat_id, day)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_notification ON deliveries (notification_id, status)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            name TEXT PRIMARY KEY,
+            next_run_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS photo_cache (
+            digest TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            last_used REAL NOT NULL DEFAULT 0
+        )
+    """)
+    # Caches created before pruning: rows count as unused until their graph is sent again
+    columns = [row[1] for row in cursor.execute("PRAGMA table_info(photo_cache)")]
+    if "last_used" not in columns:
+        cursor.execute("ALTER TABLE photo_cache ADD COLUMN last_used REAL NOT NULL DEFAULT 0")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_photo_cache_last_used ON photo_cache (last_used)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            text TEXT,
+            graph BLOB,
+            graph_digest TEXT,
+            priority INTEGER NOT NULL,
+            created_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS wakeups (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            shard INTEGER NOT NULL,
+            due_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_wakeups_shard ON wakeups (shard)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            github_username TEXT NOT NULL,
+            timezone TEXT,
+            day TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            streak INTEGER NOT NULL,
+            week INTEGER NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_user_stats_updated_at ON user_stats (updated_at)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS group_members (
+            group_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (group_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_group_members_user_id ON group_members (user_id)")
     conn.commit()
-    conn.close()
-
-# Fetch commit activity from GitHub
-def fetch_commit_activity(username, token):
-    url = f"https://api.github.com/graphql"
-    headers = {"Authorization": f"Bearer {token}"}
-    query = """{
-      viewer {
-        contributionsCollection {
-          contributionCalendar {
-            weeks {
-              contributionDays {
-                contributionCount
-              }
-            }
-          }
-        }
-      }
-    }"""
-    response = requests.post(url, json={"query": query}, headers=headers)
-    if response.status_code == 200:
-        data = response.json()
-        weeks = data['data']['viewer']['contributionsCollection']['contributionCalendar']['weeks']
-        activity = [[day['contributionCount'] for day in week['contributionDays']] for week in weeks]
-        return activity
-    return []
-
-# Create a contribution graph image
-def create_contribution_graph(activity_data, github_username, output_file=None):
-    if not activity_data or all(sum(week) == 0 for week in activity_data):
-        print("No activity data available. Creating an empty contribution graph.")
-        return create_empty_contribution_graph(github_username)
-
-    box_size, padding = 20, 5
-    cols, rows = 53, 7
-    img_width, img_height = cols * (box_size + padding) + padding, rows * (box_size + padding) + padding
-    image = Image.new("RGB", (img_width, img_height), "white")
-    draw = ImageDraw.Draw(image)
 
-    colors = ["#ebedf0", "#c6e48b", "#7bc96f", "#239a3b", "#196127"]
-    daily_contributions = [day for week in activity_data for day in week]
-
-    for i, count in enumerate(daily_contributions):
-        week, day = divmod(i, 7)
-        x = padding + week * (box_size + padding)
-        y = padding + day * (box_size + padding)
-        color = colors[min(count, len(colors) - 1)]
-        draw.rectangle([x, y, x + box_size, y + box_size], fill=color)
+# Render a graph from per-cell palette levels: served from the renderer's cache, or encoded
+# on the "render" stage's processes. The renderer (NumPy and PIL) is imported on first use,
+# or by warm_up() shortly after startup.
+async def render_graph(levels):
+    import renderer
+    graph = renderer.cached_graph(levels)
+    if graph is None:
+        png = await stages.run("render", renderer.encode_levels, levels)
+        graph = renderer.cache_graph(levels, png)
+    return graph
+
+# Create a contribution graph image (PNG bytes in memory, cached by content)
+async def create_contribution_graph(calendar, github_username, output_file=None):
+    packed = calendar.packed if calendar else None
+    if packed is None or packed.total == 0:
+        print("No activity data available. Creating an empty contribution graph.")
+        return await create_empty_contribution_graph(github_username)
+
+    with metrics.timed("render"):
+        graph = await render_graph(packed.levels())  # Levels are kept up to date by the calendar
+    await archive_graph(graph, github_username)
+    return graph
+
+# Create an empty contribution graph (the same image for every user)
+async def create_empty_contribution_graph(github_username):
+    from renderer import empty_levels
+    with metrics.timed("render"):
+        graph = await render_graph(empty_levels())
+    await archive_graph(graph, github_username, "empty contribution graph")
+    return graph
+
+def write_file(path, data):
+    with open(path, 'wb') as file:
+        file.write(data)
+
+# Keep a copy of the graph in IMAGE_PATH, named after the user and the current hour. The
+# username comes straight from /github, so only GitHub's username characters are kept.
+async def archive_graph(graph, github_username, kind="contribution graph"):
+    if not ARCHIVE_GRAPHS:
+        return None
 
     now = datetime.now(pytz.timezone('Asia/Bangkok'))  # Time in Thailand timezone
-    output_filename = f"{github_username}'s {now.strftime('%Y-%m-%d %H')} contribution graph.png"
-    output_path = os.path.join(IMAGE_PATH, output_filename)
-    
-    image.save(output_path)
-    print(f"Contribution graph saved at {output_path}")
-    
-    delete_time = now + timedelta(hours=12)
-    asyncio.create_task(delete_file_after_time(output_path, delete_time))
-
-    return output_path
-
-# Create an empty contribution graph
-def create_empty_contribution_graph(github_username):
-    box_size, padding = 20, 5
-    cols, rows = 53, 7
-    img_width, img_height = cols * (box_size + padding) + padding, rows * (box_size + padding) + padding
-    image = Image.new("RGB", (img_width, img_height), "white")
-    draw = ImageDraw.Draw(image)
-
-    colors = ["#ebedf0"]  # Light color for no activity
-    daily_contributions = [0] * (cols * rows)  # No contributions
-
-    for i, count in enumerate(daily_contributions):
-        week, day = divmod(i, 7)
-        x = padding + week * (box_size + padding)
-        y = padding + day * (box_size + padding)
-        color = colors[min(count, len(colors) - 1)]
-        draw.rectangle([x, y, x + box_size, y + box_size], fill=color)
-
-    now = datetime.now(pytz.timezone('Asia/Bangkok'))
-    output_filename = f"{github_username}'s {now.strftime('%Y-%m-%d %H')} empty contribution graph.png"
-    output_path = os.path.join(IMAGE_PATH, output_filename)
-    
-    image.save(output_path)
-    print(f"Empty contribution graph saved at {output_path}")
-    
-    delete_time = now + timedelta(hours=12)
-    asyncio.create_task(delete_file_after_time(output_path, delete_time))
-
+    safe_name = re.sub(r"[^A-Za-z0-9-]", "_", github_username)[:39]  # GitHub's longest username
+    output_path = os.path.join(IMAGE_PATH, f"{safe_name}'s {now.strftime('%Y-%m-%d %H')} {kind}.png")
+    await stages.run("io", write_file, output_path, graph.png)
+    print(f"Contribution graph saved at {output_path}")  # Deleted later by the retention sweeper
     return output_path
 
-# Delete file after a specified time
-async def delete_file_after_time(file_path, delete_time):
-    now = datetime.now(pytz.timezone('Asia/Bangkok'))
-    time_diff = (delete_time - now).total_seconds()
-    if time_diff > 0:
-        await asyncio.sleep(time_diff)
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Deleted file: {file_path}")
-    else:
-        print(f"Delete time has already passed for {file_path}")
+# Fetch a notification template from the database by category, favouring higher ratings.
+# Fallback for when the in-memory pool has nothing for the tier; see sampler.fallback_picks.
+async def get_notification(category):
+    bounds = await db.aquery_one(FALLBACK_BOUNDS_SQL, (category, category))
+    for params in fallback_picks(category, bounds):
+        row = await db.aquery_one(FALLBACK_PICK_SQL, params)
+        if row:
+            return row
+    return None
+
+# Send Telegram notification through the rate-limited outbound queue
+async def send_telegram_notification(chat_id, message, context, graph=None, priority=PRIORITY_NORMAL):
+    send_queue = context.bot_data["send_queue"]
+    send_queue.enqueue(chat_id, text=message, priority=priority)
+    if graph:
+        send_queue.enqueue(chat_id, graph=graph, priority=PRIORITY_GRAPH)
 
-# Generate notification using Meta AI API
-def generate_notification(category, username, harshness):
-    try:
-        ai = MetaAI()
-        
-        if harshness == "gentle":
-            prompt = f"Generate a gentle notification for a GitHub user named {username} to encourage them to code. Keep the tone friendly and motivational. No more than 10 words."
-        elif harshness == "medium":
-            prompt = f"Generate a moderate notification for a GitHub user named {username} to encourage them to code. Keep the tone more direct but friendly. No more than 10 words."
-        else:
-            prompt = f"Generate a harsh notification for a GitHub user named {username} to encourage them to code. Be assertive and urgent. No more than 10 words."
-        
-        response = ai.prompt(message=prompt)
-        notification_message = response['message']
-        print(f"Generated notification message for category '{category}': {notification_message}")
-        return notification_message
-    except Exception as e:
-        print(f"Error generating notification message for category '{category}': {e}")
-        return None
-
-# Fetch notifications from the database by category
-def get_notification(category):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, message FROM notifications WHERE category = ? ORDER BY RANDOM() LIMIT 1", (category,))
-    row = cursor.fetchone()
-    conn.close()
-    return row
-
-# Check today's contribution from GitHub
-def check_today_contribution(username, token):
-    url = "https://api.github.com/graphql"
-    headers = {"Authorization": f"Bearer {token}"}
-    
-    query = """
-    {
-      viewer {
-        contributionsCollection {
-          contributionCalendar {
-            weeks {
-              contributionDays {
-                contributionCount
-                date
-              }
-            }
-          }
-        }
-      }
-    }
-    """
-    
-    response = requests.post(url, json={"query": query}, headers=headers)
-    
-    if response.status_code == 200:
-        data = response.json()
-        weeks = data['data']['viewer']['contributionsCollection']['contributionCalendar']['weeks']
-        
-        thailand_timezone = pytz.timezone('Asia/Bangkok')
-        today_date = datetime.now(thailand_timezone)
-        today_date_str = today_date.strftime('%Y-%m-%d')
-        
-        commit_count = 0
-        for week in weeks:
-            for day in week['contributionDays']:
-                if day['date'][:10] == today_date_str:
-                    commit_count += day['contributionCount']
-
-        return commit_count
-    else:
-        print(f"Error fetching contribution data: {response.status_code}")
-        return 0
-
-# Send Telegram notification
-async def send_telegram_notification(chat_id, message, context, image_path=None):
+# Get GitHub username and token from the database
+async def get_github_username_and_token_from_db(chat_id):
+    return await db.aquery_one("SELECT github_username, github_token FROM users WHERE id = ?", (chat_id,))
+
+# Get (chat_id, github_username, github_token, timezone, last checked day, its count, on a leaderboard)
+# rows for a batch of chats
+async def get_users_from_db(chat_ids):
+    chat_ids = list(chat_ids)
+    if not chat_ids:
+        return []
+    placeholders = ",".join("?" * len(chat_ids))
+    return await db.aquery(f"""
+        SELECT users.id, users.github_username, github_token, users.timezone, user_stats.day, user_stats.count,
+               EXISTS (SELECT 1 FROM group_members WHERE group_members.user_id = users.id)
+        FROM users LEFT JOIN user_stats ON user_stats.user_id = users.id
+        WHERE users.id IN ({placeholders})
+    """, chat_ids)
+
+# Check a batch of users: one calendar request per GitHub login, then notify each chat.
+# Leaderboard members keep being checked after they've contributed, so their counts stay
+# fresh; those follow-up checks only update their stats and don't congratulate them again.
+# Returns {chat_id: next_check_at}: the escalation curve's next check, or the token's
+# quota reset for users whose check had to be put off. While rendering or file and JSON work is
+# backed up, the whole batch is put off by CHECK_DEFER_DELAY instead.
+async def check_users(chat_ids, context):
+    if stages.saturated("render", "io"):
+        metrics.inc("deferred_checks_total", len(chat_ids))
+        return {chat_id: time.time() + CHECK_DEFER_DELAY for chat_id in chat_ids}
+
+    with metrics.timed("db_lookup"):
+        rows = await get_users_from_db(chat_ids)
+    found = {row[0] for row in rows}
+    for chat_id in chat_ids:
+        if chat_id not in found:
+            print(f"GitHub username or token not found for {chat_id}")
+
+    calendars = await fetch_calendars((row[1], row[2]) for row in rows)
+    next_checks = {}
+    results = []
+    headroom = budget.headroom()
+    for chat_id, github_username, github_token, timezone, seen_day, seen_count, on_leaderboard in rows:
+        calendar = calendars.get(github_username.lower())
+        if calendar is None or (not calendar.ok and budget.is_rate_limited(github_token)):
+            # Not fetched for lack of quota: don't report "0 commits", retry once the token resets.
+            # A calendar in hand is used even if the fetch spent the token's last point.
+            next_checks[chat_id] = budget.available_at(github_token)
+            continue
+        if not calendar.ok:
+            continue
+
+        # One user's failure stays with that user: the rest of the batch is still notified
+        tz = escalation.get_timezone(timezone)
+        try:
+            today = calendar.today_in(tz)
+            commit_count = calendar.count_on(today)
+            results.append((chat_id, today, commit_count))
+            context.bot_data["leaderboards"].record(chat_id, github_username, timezone, date.fromisoformat(today), calendar.packed)
+            if not (seen_day == today and seen_count):  # Already congratulated today
+                await notify_user(chat_id, github_username, calendar, context, tz)
+            next_checks[chat_id] = escalation.next_check_at(tz, commit_count > 0, headroom=headroom, follow_up=on_leaderboard)
+        except Exception as e:
+            metrics.inc("errors_total", stage="check_user")
+            print(f"Error checking {github_username} for {chat_id}: {e}")
+            next_checks[chat_id] = escalation.next_check_at(tz, False, headroom=headroom)  # Retry on the curve
+
+    # Credit the messages that were followed by a commit
     try:
-        await context.bot.send_message(chat_id=chat_id, text=message)
-        
-        if image_path:
-            with open(image_path, 'rb') as img_file:
-                await context.bot.send_photo(chat_id=chat_id, photo=img_file)
+        await attribute(results, context.bot_data["message_pool"])
     except Exception as e:
-        print(f"Error sending Telegram notification: {e}")
-
-# Get GitHub username and token from the database
-def get_github_username_and_token_from_db(chat_id):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT github_username, github_token FROM users WHERE id = ?", (chat_id,))
-    result = cursor.fetchone()
-    conn.close()
-    return result
-
-# Monitor contributions and send notifications
-async def monitor_contributions(chat_id, context):
-    result = get_github_username_and_token_from_db(chat_id)
-    if not result:
-        print(f"GitHub username or token not found for {chat_id}")
-        return
+        metrics.inc("errors_total", stage="attribution")
+        print(f"Error attributing commits for {len(results)} user(s): {e}")
+    return next_checks
+
+# Send a message from the pool and log the delivery for rating attribution
+async def send_pool_message(chat_id, tier, github_username, calendar, context, tz, priority=PRIORITY_NORMAL):
+    notification = context.bot_data["message_pool"].get_message(tier, github_username)
+    if notification is None:
+        notification = await get_notification(tier)
+        if notification:
+            notification = notification[0], render_template(notification[1], github_username)
+    if notification:
+        notification_id, message = notification
+        await send_telegram_notification(chat_id, message, context, priority=priority)
+        record_delivery(chat_id, notification_id, calendar.today_in(tz), calendar.count_today(tz))
+
+# Send notifications for one user based on their calendar and how close their midnight is
+async def notify_user(chat_id, github_username, calendar, context, tz):
+    commit_count = calendar.count_today(tz)
 
-    github_username, github_token = result
-    commit_count = check_today_contribution(github_username, github_token)
-    
     if commit_count > 0:
         print(f"User has committed {commit_count} time(s) today.")
         
         commit_message = f"Yay! You've committed {commit_count} time(s) today. Keep it up!"
+        streak = calendar.streak_in(tz)
+        if streak > 1:
+            commit_message += f" That's a {streak}-day streak (longest: {calendar.longest_streak})."
         await send_telegram_notification(chat_id, commit_message, context)
         
-        notification_message = generate_notification("gentle", github_username, "gentle")
-        if notification_message:
-            await send_telegram_notification(chat_id, notification_message, context)
+        await send_pool_message(chat_id, "gentle", github_username, calendar, context, tz)
 
-        activity_data = fetch_commit_activity(github_username, github_token)
-        if activity_data:
-            graph_path = create_contribution_graph(activity_data, github_username)
-            await send_telegram_notification(chat_id, "Here is your contribution graph:", context, graph_path)
+        if calendar.packed:
+            graph = await create_contribution_graph(calendar, github_username)
+            await send_telegram_notification(chat_id, "Here is your contribution graph:", context, graph)
 
     else:
-        graph_path = create_contribution_graph([], github_username)  # Pass an empty list for no commits
-        await send_telegram_notification(chat_id, "You haven't made any contributions today. Here's your empty contribution graph:", context, graph_path)
+        graph = await create_contribution_graph(None, github_username)  # No calendar for no commits
+        await send_telegram_notification(chat_id, "You haven't made any contributions today. Here's your empty contribution graph:", context, graph)
 
-        print("No commits today. Checking for time to send harsh notification.")
-        current_hour = datetime.now().hour
-        if current_hour >= 18:
+        tier = escalation.tier_for(tz)
+        print(f"No commits today. Sending a {tier} reminder.")
+        if tier == "harsh":
             harsh_message = "Final Coding Warning: Inactivity Detected. Get coding now!"
-            await send_telegram_notification(chat_id, harsh_message, context)
+            await send_telegram_notification(chat_id, harsh_message, context, priority=PRIORITY_URGENT)
             
-            notification_message = generate_notification("harsh", github_username, "harsh")
-            if notification_message:
-                await send_telegram_notification(chat_id, notification_message, context)
-
-    await asyncio.sleep(3 * 3600)  # Sleep for 3 hours before checking again
-    await monitor_contributions(chat_id, context)
+            await send_pool_message(chat_id, "harsh", github_username, calendar, context, tz, priority=PRIORITY_URGENT)
+        else:
+            await send_pool_message(chat_id, tier, github_username, calendar, context, tz)
 
 # Telegram bot command: start
 async def start(update: Update, context: CallbackContext):
@@ -297,27 +356,214 @@ async def github_info(update: Update, context: CallbackContext):
         telegram_username = update.effective_user.username
         chat_id = update.effective_chat.id
 
-        conn = sqlite3.connect(DATABASE_PATH)
-        cursor = conn.cursor()
-        cursor.execute("INSERT INTO users (id, telegram_username, github_username, github_token) VALUES (?, ?, ?, ?)", (chat_id, telegram_username, github_username, github_token))
-        conn.commit()
-        conn.close()
+        await db.write("""
+            INSERT INTO users (id, telegram_username, github_username, github_token) VALUES (?, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                telegram_username = excluded.telegram_username,
+                github_username = excluded.github_username,
+                github_token = excluded.github_token
+        """, (chat_id, telegram_username, github_username, github_token))
 
+        context.application.bot_data["scheduler"].schedule(chat_id)  # First check runs right away, even if the reply fails
         await update.message.reply_text(f"GitHub username and token set for {github_username}!")
-        asyncio.create_task(monitor_contributions(chat_id, context))  # Start monitoring in the background
 
     except Exception as e:
         await update.message.reply_text(str(e))
 
-# Main program to initialize everything
-def main():
-    application = Application.builder().token(BOT_TOKEN).build()
+# Telegram bot command: set timezone
+async def set_timezone(update: Update, context: CallbackContext):
+    user_input = update.message.text.split()
+    if len(user_input) != 2 or not escalation.is_valid_timezone(user_input[1]):
+        await update.message.reply_text("Please provide a timezone like Asia/Bangkok or Europe/Berlin")
+        return
+
+    chat_id = update.effective_chat.id
+    result = await db.write("UPDATE users SET timezone = ? WHERE id = ?", (user_input[1], chat_id))
+    if not result.rowcount:
+        await update.message.reply_text("Please set your GitHub username and token with /github first")
+        return
+
+    context.application.bot_data["scheduler"].schedule(chat_id)  # Re-plan checks on the new clock
+    await update.message.reply_text(f"Timezone set to {user_input[1]}!")
+
+# Telegram bot command (group chats): join this group's leaderboard
+async def join_leaderboard(update: Update, context: CallbackContext):
+    if update.effective_chat.type == "private":
+        await update.message.reply_text("Send /join in a group chat to compete on its /leaderboard")
+        return
+
+    leaderboards = context.application.bot_data["leaderboards"]
+    if not await leaderboards.join(update.effective_chat.id, update.effective_user.id):
+        await update.message.reply_text("Please set your GitHub username and token with /github in a private chat with me first")
+        return
+    context.application.bot_data["scheduler"].schedule(update.effective_user.id)  # Fresh stats, and the follow-up cadence from now on
+    await update.message.reply_text(f"{update.effective_user.first_name} joined the leaderboard!")
+
+# Telegram bot command (group chats): leave this group's leaderboard
+async def leave_leaderboard(update: Update, context: CallbackContext):
+    if update.effective_chat.type == "private":
+        return
+    await context.application.bot_data["leaderboards"].leave(update.effective_chat.id, update.effective_user.id)
+    await update.message.reply_text(f"{update.effective_user.first_name} left the leaderboard")
+
+# Telegram bot command (group chats): rank members by today's count, streak or weekly total
+async def show_leaderboard(update: Update, context: CallbackContext):
+    if update.effective_chat.type == "private":
+        await update.message.reply_text("Add me to a group and send /join there to compare with friends")
+        return
+
+    user_input = update.message.text.split()
+    order = user_input[1].lower() if len(user_input) > 1 else DEFAULT_ORDER
+    if order not in ORDERS:
+        await update.message.reply_text(f"Rank by one of: {', '.join(ORDERS)}")
+        return
+    text = context.application.bot_data["leaderboards"].text(update.effective_chat.id, update.effective_user.id, order)
+    await update.message.reply_text(text)
+
+# Preload what the first check and refill need once the bot is taking commands: the imaging
+# stack is imported on a thread, the render processes start by rendering the empty graph,
+# and the AI client (if `message_pool` refills) connects on the "ai" stage's thread
+async def warm_up(message_pool=None):
+    await asyncio.sleep(WARMUP_DELAY)
+    try:
+        renderer = await asyncio.to_thread(importlib.import_module, "renderer")
+        await render_graph(renderer.empty_levels())  # The graph most checks send, now cached
+        if message_pool:
+            await message_pool.warm_up()
+    except Exception as e:
+        print(f"Error warming up: {e}")
+
+# Start the outbound send queue and message pool, rebuild the monitoring schedule and start dispatching checks.
+# With SHARDS set, checks run in worker processes instead and their messages arrive through the outbox.
+async def post_init(application):
+    db.start()
+    stages.start()
+
+    send_queue = SendQueue(application.bot)
+    send_queue.start()
+    application.bot_data["send_queue"] = send_queue
+
+    message_pool = MessagePool()
+    await message_pool.load()
+    message_pool.start()
+    application.bot_data["message_pool"] = message_pool
+
+    leaderboards = Leaderboards()
+    await leaderboards.load()
+    application.bot_data["leaderboards"] = leaderboards
+    application.bot_data["jobs"] = [
+        asyncio.create_task(run_periodic(PRUNE_JOB, PRUNE_INTERVAL, lambda: prune_notifications(message_pool))),
+        asyncio.create_task(run_periodic(PHOTO_PRUNE_JOB, PHOTO_PRUNE_INTERVAL, prune_photo_cache)),
+        asyncio.create_task(run_sweeper()),
+        asyncio.create_task(metrics.watch_loop_lag()),
+        asyncio.create_task(warm_up(message_pool)),
+    ]
+    if METRICS_PORT:
+        application.bot_data["jobs"].append(asyncio.create_task(metrics.serve()))
+
+    if SHARDS:
+        scheduler = ShardRouter(run_worker, SHARDS)
+        application.bot_data["jobs"].append(asyncio.create_task(drain_outbox(send_queue)))
+        application.bot_data["jobs"].append(asyncio.create_task(leaderboards.follow()))  # Results arrive from the workers
+    else:
+        scheduler = Scheduler(lambda chat_ids: check_users(chat_ids, application))
+        application.bot_data["jobs"].append(asyncio.create_task(scheduler.load()))  # Pages in while polling starts
+        application.bot_data["jobs"].append(asyncio.create_task(take_outbox(send_queue)))  # Left unsent by the last shutdown
+    scheduler.start()
+    application.bot_data["scheduler"] = scheduler
+
+# Stop the scheduler, flush outbound messages and database writes, and release pooled connections on shutdown
+async def shutdown(application):
+    await application.bot_data["scheduler"].stop()
+    for job in application.bot_data["jobs"]:
+        job.cancel()
+    await asyncio.gather(*application.bot_data["jobs"], return_exceptions=True)
+    await application.bot_data["message_pool"].stop()
+    send_queue = application.bot_data["send_queue"]
+    await send_queue.stop()
+    print(f"Send queue: {send_queue.stats}, drop rate {send_queue.drop_rate():.1%}")
+    stages.shutdown()
+    await http_client.close()
+    await db.close()
+
+# Worker process for one shard: checks the shard's users and queues their messages in the outbox.
+# Runs until SIGTERM (sent by ShardRouter.stop) or SIGINT.
+async def serve_shard(shard, shards):
+    db.start()
+    stages.start()
+    message_pool = MessagePool()  # Read-only copy; the bot process refills the pool
+    await message_pool.load()
+    # Results are only stored here; the bot process ranks them (Leaderboards.follow)
+    context = SimpleNamespace(bot_data={"send_queue": Outbox(), "message_pool": message_pool, "leaderboards": Leaderboards()})
+
+    scheduler = Scheduler(lambda chat_ids: check_users(chat_ids, context))
+    scheduler.start()
+    jobs = [
+        asyncio.create_task(scheduler.load(shard, shards)),
+        asyncio.create_task(warm_up()),
+        asyncio.create_task(poll_wakeups(scheduler, shard)),
+        asyncio.create_task(refresh_pool(message_pool)),
+        asyncio.create_task(metrics.watch_loop_lag()),
+    ]
+    if METRICS_PORT:
+        jobs.append(asyncio.create_task(metrics.serve(port=METRICS_PORT + 1 + shard)))
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stopping.set)
+    await stopping.wait()
+
+    await scheduler.stop()
+    for job in jobs:
+        job.cancel()
+    await asyncio.gather(*jobs, return_exceptions=True)
+    stages.shutdown()
+    await http_client.close()
+    await db.close()
+
+def run_worker(shard, shards):
+    asyncio.run(serve_shard(shard, shards))
+
+# Application with the bot's command handlers. Benchmarks pass their own `builder`
+# (no startup hooks, fake Bot API); updates are handled up to CONCURRENT_UPDATES at a time.
+def build_application(builder=None):
+    if builder is None:
+        builder = Application.builder().token(BOT_TOKEN).post_init(post_init).post_shutdown(shutdown)
+        if TELEGRAM_API_URL:
+            builder = builder.base_url(TELEGRAM_API_URL)
+    application = builder.concurrent_updates(CONCURRENT_UPDATES).build()
     application.add_handler(CommandHandler("start", start))
     application.add_handler(CommandHandler("github", github_info))
+    application.add_handler(CommandHandler("timezone", set_timezone))
+    application.add_handler(CommandHandler("join", join_leaderboard))
+    application.add_handler(CommandHandler("leave", leave_leaderboard))
+    application.add_handler(CommandHandler("leaderboard", show_leaderboard))
+    return application
+
+# Serve updates Telegram pushes to WEBHOOK_URL; requests without the secret token are rejected
+def run_webhook(application):
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL must be set when BOT_MODE is 'webhook'")
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET or secrets.token_urlsafe(32),
+        max_connections=WEBHOOK_MAX_CONNECTIONS,
+    )
+
+# Main program to initialize everything
+def main():
+    application = build_application()
 
     init_database()
 
-    application.run_polling()
+    if BOT_MODE == "webhook":
+        run_webhook(application)
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,46 @@
+from collections import OrderedDict
+import db
+from packed_calendar import PackedCalendar
+from config import CALENDAR_CACHE_SIZE
+
+# Recently stored calendars, kept live so a delta is applied to the existing summary instead of
+# one rebuilt from the BLOB. An entry is only used while the stored row still holds what it wrote.
+_live = OrderedDict()  # login -> (start, counts BLOB, PackedCalendar), least recently used first
+
+
+# A full year is only needed for new logins and once per day; everything else is a delta
+async def needs_full_refresh(github_username, today):
+    row = await db.aquery_one("SELECT full_synced_on FROM calendars WHERE github_username = ?", (github_username.lower(),))
+    return row is None or row[0] != today.isoformat()
+
+
+# The stored calendar moved to end `today`, or an empty one for a login we haven't seen
+async def load_calendar(github_username, today):
+    login = github_username.lower()
+    row = await db.aquery_one("SELECT start, counts FROM calendars WHERE github_username = ?", (login,))
+    if row is None or row[0] is None:
+        return PackedCalendar.empty(today)
+    live = _live.get(login)
+    if live is not None and live[:2] == tuple(row):
+        _live.move_to_end(login)
+        return live[2].rebase(today)
+    return PackedCalendar.from_blob(row[0], row[1], today)
+
+
+# Merge fetched (day, count) pairs into the stored calendar and return it; `full_synced_on`
+# marks a full-year refresh. One row per login: the window is a single BLOB.
+async def save_days(github_username, days, today, full_synced_on=None):
+    login = github_username.lower()
+    calendar = (await load_calendar(login, today)).merge(days)
+    start, counts = calendar.start.isoformat(), calendar.to_blob()
+    _live.pop(login, None)  # Until the write lands
+    await db.write(
+        "INSERT INTO calendars (github_username, full_synced_on, start, counts) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(github_username) DO UPDATE SET start = excluded.start, counts = excluded.counts, "
+        "full_synced_on = COALESCE(excluded.full_synced_on, calendars.full_synced_on)",
+        (login, full_synced_on.isoformat() if full_synced_on else None, start, counts),
+    )
+    _live[login] = (start, counts, calendar)
+    if len(_live) > CALENDAR_CACHE_SIZE:
+        _live.popitem(last=False)
+    return calendar
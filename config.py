@@ -0,0 +1,76 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Constants
+BOT_TOKEN = os.getenv('BOT_TOKEN')  # Your Telegram Bot Token
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL')  # Bot API base URL for a local Bot API server; defaults to api.telegram.org
+DATABASE_PATH = os.getenv('DATABASE_PATH', './notifications.db')  # Default to './notifications.db' if not provided
+IMAGE_PATH = os.getenv('IMAGE_PATH', './Images')  # Default to './Images' if not provided
+ARCHIVE_GRAPHS = os.getenv('ARCHIVE_GRAPHS', '1') == '1'  # Also keep sent graphs in IMAGE_PATH
+IMAGE_MAX_AGE = int(os.getenv('IMAGE_MAX_AGE', str(12 * 3600)))  # Archived graphs older than this are deleted
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', str(200 * 1024 * 1024)))  # Cap on the total size of IMAGE_PATH
+IMAGE_SWEEP_INTERVAL = int(os.getenv('IMAGE_SWEEP_INTERVAL', '3600'))  # Seconds between retention sweeps
+
+# Update ingestion
+WARMUP_DELAY = float(os.getenv('WARMUP_DELAY', '2'))  # Seconds after startup before the imaging stack and AI client are preloaded
+BOT_MODE = os.getenv('BOT_MODE', 'polling')  # 'polling' or 'webhook'
+WEBHOOK_URL = os.getenv('WEBHOOK_URL')  # Public HTTPS base URL Telegram posts updates to (webhook mode)
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '127.0.0.1')  # Local address of the webhook server
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8443'))
+WEBHOOK_PATH = os.getenv('WEBHOOK_PATH', 'telegram')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET')  # Checked against X-Telegram-Bot-Api-Secret-Token; random if not set
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))  # Connections Telegram may open at once
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '8'))  # Updates handled at once, in either mode
+
+# Outbound HTTP (one shared connection pool)
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '30'))  # Seconds per request
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', '100'))
+HTTP_PER_HOST_LIMIT = int(os.getenv('HTTP_PER_HOST_LIMIT', '20'))  # Max requests in flight per host
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+HTTP_MAX_RETRY_WAIT = float(os.getenv('HTTP_MAX_RETRY_WAIT', '60'))  # Don't wait longer than this for a Retry-After
+
+# GitHub
+GITHUB_GRAPHQL_URL = os.getenv('GITHUB_GRAPHQL_URL', 'https://api.github.com/graphql')  # Overridable for GitHub Enterprise or a local stand-in
+CALENDAR_CACHE_SIZE = int(os.getenv('CALENDAR_CACHE_SIZE', '4096'))  # Recently fetched calendars kept in memory (per process)
+
+# Database access
+DB_READERS = int(os.getenv('DB_READERS', '4'))  # Reader threads for async queries
+DB_WRITE_BATCH_SIZE = int(os.getenv('DB_WRITE_BATCH_SIZE', '200'))  # Max statements committed per transaction
+
+# Monitoring schedule
+CHECK_INTERVAL = int(os.getenv('CHECK_INTERVAL', str(3 * 3600)))  # Seconds between checks of the same user
+SCHEDULER_BATCH_SIZE = int(os.getenv('SCHEDULER_BATCH_SIZE', '50'))  # Users dispatched per batch
+SCHEDULER_WORKERS = int(os.getenv('SCHEDULER_WORKERS', '4'))  # Batches checked concurrently
+SHARDS = int(os.getenv('SHARDS', '0'))  # Worker processes splitting the users between them; 0 checks users in the bot process
+
+# Stage executors (per bot or shard process)
+STAGE_THREADS = int(os.getenv('STAGE_THREADS', '4'))  # Threads for JSON decoding and file writes off the event loop
+RENDER_PROCESSES = int(os.getenv('RENDER_PROCESSES', '2'))  # Processes encoding contribution graph PNGs
+RENDER_QUEUE_LIMIT = int(os.getenv('RENDER_QUEUE_LIMIT', '32'))  # Graphs queued or rendering before new checks are deferred
+IO_QUEUE_LIMIT = int(os.getenv('IO_QUEUE_LIMIT', '64'))  # Calendar decodes and graph writes queued or running before new checks are deferred
+CHECK_DEFER_DELAY = float(os.getenv('CHECK_DEFER_DELAY', '15'))  # Seconds a deferred check waits before it's tried again
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', '256'))  # Rendered PNGs kept in memory (per process)
+
+# Outbound Telegram limits
+SEND_GLOBAL_RATE = float(os.getenv('SEND_GLOBAL_RATE', '30'))  # Messages per second across all chats
+SEND_CHAT_RATE = float(os.getenv('SEND_CHAT_RATE', '1'))  # Messages per second to a single chat
+SEND_CONCURRENCY = int(os.getenv('SEND_CONCURRENCY', '16'))  # Sends in flight at once
+PHOTO_CACHE_SIZE = int(os.getenv('PHOTO_CACHE_SIZE', '4096'))  # Uploaded graphs' file_ids kept in memory
+PHOTO_CACHE_MAX_AGE = int(os.getenv('PHOTO_CACHE_MAX_AGE', str(7 * 86400)))  # Stored file_ids unused this long are deleted
+
+# Group leaderboards
+LEADERBOARD_SIZE = int(os.getenv('LEADERBOARD_SIZE', '10'))  # Members listed by /leaderboard
+LEADERBOARD_FOLLOW_INTERVAL = float(os.getenv('LEADERBOARD_FOLLOW_INTERVAL', '5'))  # Seconds between reads of shard workers' results
+
+# Observability
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))  # Serve /metrics on this port (shard workers use the following ports); 0 disables
+PROFILE_CYCLES = int(os.getenv('PROFILE_CYCLES', '0'))  # cProfile this many check cycles, one .prof file each
+PROFILE_DIR = os.getenv('PROFILE_DIR', './profiles')
+
+# Notification message pool
+POOL_TARGET = int(os.getenv('POOL_TARGET', '20'))  # Ready messages kept per harshness tier
+POOL_REFILL_INTERVAL = int(os.getenv('POOL_REFILL_INTERVAL', '3600'))  # Seconds between pool top-ups
@@ -0,0 +1,203 @@
+import asyncio
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import metrics
+from config import DATABASE_PATH, DB_READERS, DB_WRITE_BATCH_SIZE
+
+# Shared SQLite access layer.
+#  - Every connection runs in WAL mode, so readers never wait for the writer.
+#  - Connections are long-lived and per thread; sqlite3 keeps their prepared statements cached.
+#  - Async reads run on a small pool of reader threads instead of the event loop.
+#  - Async writes go through one writer task that commits queued statements in a single transaction.
+
+STATEMENT_CACHE_SIZE = 256
+BUSY_TIMEOUT_MS = 5000
+
+_local = threading.local()
+_connections = []
+_connections_lock = threading.Lock()
+_readers = None
+_writer = None
+
+
+def _connect():
+    conn = sqlite3.connect(DATABASE_PATH, check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+    with _connections_lock:
+        _connections.append(conn)
+    return conn
+
+
+# The calling thread's long-lived connection
+def get_connection():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _connect()
+    return conn
+
+
+# Synchronous helpers, for startup code and plain threads
+def query(sql, params=()):
+    return get_connection().execute(sql, params).fetchall()
+
+
+def query_one(sql, params=()):
+    return get_connection().execute(sql, params).fetchone()
+
+
+def execute(sql, params=(), many=False):
+    conn = get_connection()
+    with conn:
+        cursor = conn.executemany(sql, params) if many else conn.execute(sql, params)
+        return _result(cursor)
+
+
+def _result(cursor):
+    rows = cursor.fetchall() if cursor.description else None
+    return WriteResult(cursor.rowcount, cursor.lastrowid, rows)
+
+
+class WriteResult:
+    __slots__ = ("rowcount", "lastrowid", "rows")
+
+    def __init__(self, rowcount, lastrowid, rows):
+        self.rowcount = rowcount
+        self.lastrowid = lastrowid
+        self.rows = rows
+
+
+# Async reads: run on a reader thread with its own connection
+async def aquery(sql, params=()):
+    global _readers
+    if _readers is None:
+        _readers = ThreadPoolExecutor(max_workers=DB_READERS, thread_name_prefix="db-reader")
+    return await asyncio.get_running_loop().run_in_executor(_readers, query, sql, params)
+
+
+async def aquery_one(sql, params=()):
+    rows = await aquery(sql, params)
+    return rows[0] if rows else None
+
+
+# Fire-and-forget writes would otherwise fail silently
+def _log_failed_write(future):
+    if not future.cancelled() and future.exception() is not None:
+        metrics.inc("errors_total", stage="db_write")
+        print(f"Database write failed: {future.exception()}")
+
+
+class _Writer:
+    """Single writer: drains queued statements and commits each batch in one transaction."""
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._task = asyncio.create_task(self._run())
+
+    def submit(self, sql, params, many):
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_log_failed_write)
+        self._queue.put_nowait((sql, params, many, future))
+        return future
+
+    def depth(self):
+        return self._queue.qsize()
+
+    @staticmethod
+    def _apply(batch):
+        conn = get_connection()
+        results = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for sql, params, many, _ in batch:
+                # A savepoint per statement, so one bad write doesn't roll back its neighbours
+                conn.execute("SAVEPOINT write")
+                try:
+                    cursor = conn.executemany(sql, params) if many else conn.execute(sql, params)
+                    results.append(_result(cursor))
+                    conn.execute("RELEASE write")
+                except sqlite3.Error as e:
+                    conn.execute("ROLLBACK TO write")
+                    conn.execute("RELEASE write")
+                    results.append(e)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return results
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            while len(batch) < DB_WRITE_BATCH_SIZE and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if batch[-1] is None:  # Stop marker from close(); everything before it is still written
+                batch.pop()
+                stopping = True
+            if not batch:
+                continue
+            try:
+                results = await loop.run_in_executor(self._executor, self._apply, batch)
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, _, _, future), result in zip(batch, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    async def close(self):
+        self._queue.put_nowait(None)
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._executor.shutdown(wait=True)
+
+
+def start():
+    global _writer
+    if _writer is None:
+        _writer = _Writer()
+        metrics.gauge("db_write_queue_depth", "Database writes waiting for the writer", write_queue_depth)
+
+
+# Queue a write and return a future for its WriteResult. Without a running writer
+# (scripts, plain threads) the write is applied synchronously instead.
+def submit(sql, params=(), many=False):
+    if _writer is not None:
+        return _writer.submit(sql, params, many)
+    result = execute(sql, params, many)
+    try:
+        future = asyncio.get_running_loop().create_future()
+    except RuntimeError:
+        return None
+    future.set_result(result)
+    return future
+
+
+async def write(sql, params=(), many=False):
+    return await submit(sql, params, many)
+
+
+def write_queue_depth():
+    return _writer.depth() if _writer else 0
+
+
+async def close():
+    global _writer, _readers
+    if _writer is not None:
+        await _writer.close()
+        _writer = None
+    if _readers is not None:
+        _readers.shutdown(wait=True)
+        _readers = None
+    with _connections_lock:
+        for conn in _connections:
+            conn.close()
+        _connections.clear()
+    _local.__dict__.clear()
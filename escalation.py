@@ -0,0 +1,77 @@
+from datetime import datetime, time, timedelta
+import pytz
+
+# Escalation curve: checks are sparse early in the user's day and get denser towards
+# their midnight, moving from gentle to medium to harsh reminders. Once the user has
+# contributed, checking stops until the next morning, except for group leaderboard
+# members, who are checked every MAX_INTERVAL so their counts stay current.
+
+DEFAULT_TIMEZONE = 'Asia/Bangkok'
+DAY_START_HOUR = 8  # First check of the day, local time
+MIN_INTERVAL = 30 * 60  # Densest cadence, right before midnight
+MAX_INTERVAL = 4 * 3600  # Sparsest cadence, in the morning
+INTERVAL_SHARE = 0.4  # Next check after this share of the time left in the day
+LAST_CALL = 15 * 60  # Final check this long before midnight
+
+MEDIUM_HOURS_LEFT = 8  # Medium reminders when fewer hours than this are left
+HARSH_HOURS_LEFT = 3  # Harsh reminders when fewer hours than this are left
+
+
+def get_timezone(name):
+    try:
+        return pytz.timezone(name or DEFAULT_TIMEZONE)
+    except pytz.UnknownTimeZoneError:
+        return pytz.timezone(DEFAULT_TIMEZONE)
+
+
+def is_valid_timezone(name):
+    return name in pytz.all_timezones_set
+
+
+def _local_midnight(tz, day):
+    return tz.localize(datetime.combine(day, time.min))
+
+
+def _day_start(tz, day):
+    return tz.localize(datetime.combine(day, time(DAY_START_HOUR)))
+
+
+def seconds_left_today(tz, now=None):
+    local = datetime.fromtimestamp(now if now is not None else datetime.now().timestamp(), tz)
+    return (_local_midnight(tz, local.date() + timedelta(days=1)) - local).total_seconds()
+
+
+# Harshness tier for a user who hasn't contributed yet
+def tier_for(tz, now=None):
+    hours_left = seconds_left_today(tz, now) / 3600
+    if hours_left < HARSH_HOURS_LEFT:
+        return "harsh"
+    if hours_left < MEDIUM_HOURS_LEFT:
+        return "medium"
+    return "gentle"
+
+
+# Epoch time of the user's next check. `headroom` is the share of GitHub quota left
+# across all tokens (see RateBudget.headroom); when it runs low, checks are spread out.
+def next_check_at(tz, contributed, now=None, headroom=1.0, follow_up=False):
+    now = datetime.now().timestamp() if now is None else now
+    local = datetime.fromtimestamp(now, tz)
+    today = local.date()
+
+    if local < _day_start(tz, today):
+        return _day_start(tz, today).timestamp()
+
+    last_call = _local_midnight(tz, today + timedelta(days=1)).timestamp() - LAST_CALL
+    if last_call - now < MIN_INTERVAL / 2:
+        return _day_start(tz, today + timedelta(days=1)).timestamp()
+    if contributed:
+        if follow_up:  # Leaderboard members: keep today's count fresh at the sparsest cadence
+            return min(now + MAX_INTERVAL, last_call)
+        return _day_start(tz, today + timedelta(days=1)).timestamp()
+
+    interval = min(MAX_INTERVAL, max(MIN_INTERVAL, (last_call - now) * INTERVAL_SHARE))
+    if headroom < 0.5:
+        interval /= max(headroom, 0.1) * 2
+    if now + interval > last_call - MIN_INTERVAL / 2:
+        return last_call
+    return now + interval
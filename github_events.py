@@ -0,0 +1,76 @@
+import time
+from datetime import datetime
+import requests
+import db
+
+# Conditional polling of GitHub's public events API, for test6.py's today check.
+# Per user we keep the ETag, GitHub's X-Poll-Interval, the newest event id seen and
+# today's push count. Polls send If-None-Match; a 304 means nothing changed, costs no
+# rate limit, and the cached count is reused. On a 200 only events newer than the
+# last seen one are looked at.
+
+EVENTS_URL = "https://api.github.com/users/{}/events/public"
+DEFAULT_POLL_INTERVAL = 60  # Seconds, GitHub's usual X-Poll-Interval
+REQUEST_TIMEOUT = 30
+
+
+def _load_state(username):
+    return db.query_one(
+        "SELECT etag, poll_interval, last_event_id, day, push_count, polled_at FROM event_polls WHERE username = ?",
+        (username,),
+    )
+
+
+def _save_state(username, etag, poll_interval, last_event_id, day, push_count, polled_at):
+    db.execute(
+        "INSERT OR REPLACE INTO event_polls (username, etag, poll_interval, last_event_id, day, push_count, polled_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (username, etag, poll_interval, last_event_id, day, push_count, polled_at),
+    )
+
+
+def _poll_interval(response, default):
+    try:
+        return int(response.headers.get("X-Poll-Interval", default))
+    except ValueError:
+        return default
+
+
+# Today's PushEvents for `username`: returns (contributed, count)
+def check_today_pushes(username, token):
+    today = datetime.now().strftime('%Y-%m-%d')
+    now = time.time()
+    state = _load_state(username)
+    etag, poll_interval, last_event_id, day, push_count, polled_at = state or (None, DEFAULT_POLL_INTERVAL, 0, today, 0, 0)
+    if day != today:
+        day, push_count = today, 0  # Pushes already seen belong to an earlier day
+
+    if now < polled_at + poll_interval:
+        return push_count > 0, push_count  # GitHub asked us not to poll again yet
+
+    headers = {"Authorization": f"token {token}"}
+    if etag:
+        headers["If-None-Match"] = etag
+    try:
+        response = requests.get(EVENTS_URL.format(username), headers=headers, timeout=REQUEST_TIMEOUT)
+    except requests.RequestException as e:
+        print(f"Error fetching events for {username}: {e}")
+        return push_count > 0, push_count
+
+    poll_interval = _poll_interval(response, poll_interval)
+    if response.status_code == 200:
+        etag = response.headers.get("ETag")
+        newest_id = last_event_id
+        for event in response.json():  # Newest first
+            event_id = int(event['id'])
+            if event_id <= last_event_id:
+                break
+            newest_id = max(newest_id, event_id)
+            if event['type'] == 'PushEvent' and event['created_at'][:10] == today:
+                push_count += 1
+        last_event_id = newest_id
+    elif response.status_code != 304:
+        print(f"Error fetching events for {username}: {response.status_code}")
+
+    _save_state(username, etag, poll_interval, last_event_id, day, push_count, now)
+    return push_count > 0, push_count
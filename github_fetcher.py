@@ -0,0 +1,172 @@
+import asyncio
+import json
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+import pytz
+import http_client
+import metrics
+import stages
+from rate_budget import budget
+import calendar_store
+from packed_calendar import PackedCalendar
+from config import GITHUB_GRAPHQL_URL
+
+TIMEZONE = pytz.timezone('Asia/Bangkok')
+DELTA_DAYS = 2  # Days covered by a routine (delta) fetch
+
+# One query gives both today's count and the 53-week grid, plus the token's quota.
+# Used on first registration and once per day; routine checks use DELTA_QUERY.
+# The calendar is read by login, not from the token's `viewer`: chats that share a login
+# share one fetch and one stored calendar, whichever of their tokens made the request.
+CALENDAR_QUERY = """
+query($login: String!) {
+  rateLimit {
+    limit
+    remaining
+    resetAt
+  }
+  user(login: $login) {
+    contributionsCollection {
+      contributionCalendar {
+        weeks {
+          contributionDays {
+            contributionCount
+            date
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# Same shape, restricted to a from/to window (the last few days, so every user timezone's today is covered)
+DELTA_QUERY = """
+query($login: String!, $from: DateTime!, $to: DateTime!) {
+  rateLimit {
+    limit
+    remaining
+    resetAt
+  }
+  user(login: $login) {
+    contributionsCollection(from: $from, to: $to) {
+      contributionCalendar {
+        weeks {
+          contributionDays {
+            contributionCount
+            date
+          }
+        }
+      }
+    }
+  }
+}
+"""
+
+# Result of one calendar fetch, shared by the notification logic and the graph renderer
+@dataclass
+class ContributionCalendar:
+    github_username: str
+    packed: PackedCalendar = None  # 53 weeks ending today, None when the fetch failed
+    status_code: int = 0
+
+    @property
+    def ok(self):
+        return self.status_code == 200
+
+    def count_on(self, date_str):
+        return self.packed.count_on(date.fromisoformat(date_str)) if self.packed else 0
+
+    # Today's date for a user in timezone `tz`
+    def today_in(self, tz):
+        return datetime.now(tz).strftime('%Y-%m-%d')
+
+    def count_today(self, tz):
+        return self.count_on(self.today_in(tz))
+
+    # Current streak on the user's own day (the calendar ends on TIMEZONE's today)
+    def streak_in(self, tz):
+        return self.packed.streak_as_of(date.fromisoformat(self.today_in(tz))) if self.packed else 0
+
+    @property
+    def longest_streak(self):
+        return self.packed.longest_streak if self.packed else 0
+
+
+def parse_days(data):
+    weeks = data['data']['user']['contributionsCollection']['contributionCalendar']['weeks']
+    return [(day['date'][:10], day['contributionCount']) for week in weeks for day in week['contributionDays']]
+
+
+# Full year on first sight of a login and once per day, otherwise just the last DELTA_DAYS days
+async def _build_request(github_username, now):
+    today = now.date()
+    if await calendar_store.needs_full_refresh(github_username, today):
+        return {"query": CALENDAR_QUERY, "variables": {"login": github_username}}, today
+    window_start = TIMEZONE.localize(datetime.combine(today - timedelta(days=DELTA_DAYS - 1), time.min))
+    variables = {"login": github_username, "from": window_start.isoformat(), "to": now.isoformat()}
+    return {"query": DELTA_QUERY, "variables": variables}, None
+
+
+async def _fetch_calendar(github_username, token):
+    headers = {"Authorization": f"Bearer {token}"}
+    budget.spend(token)
+    try:
+        now = datetime.now(TIMEZONE)
+        payload, full_synced_on = await _build_request(github_username, now)
+        with metrics.timed("github_fetch"):
+            response = await http_client.request("POST", GITHUB_GRAPHQL_URL, json=payload, headers=headers)
+        budget.record_headers(token, response.status_code, response.headers)
+        if response.status_code != 200:
+            if response.status_code in (403, 429):
+                metrics.inc("rate_limit_hits_total", source="github")
+            else:
+                metrics.inc("errors_total", stage="github_fetch")
+            print(f"Error fetching contribution data for {github_username}: {response.status_code}")
+            return ContributionCalendar(github_username, None, response.status_code)
+        # A full year is tens of kilobytes of JSON; decode it off the event loop
+        data = await stages.run("io", json.loads, response.content) if full_synced_on else response.json()
+        if any(error.get('type') == 'RATE_LIMITED' for error in data.get('errors') or []):
+            metrics.inc("rate_limit_hits_total", source="github")
+            print(f"GraphQL rate limit hit while fetching {github_username}")
+            budget.record_headers(token, 429, {"X-RateLimit-Remaining": "0"})
+            return ContributionCalendar(github_username, None, 429)
+        budget.record_graphql(token, (data.get('data') or {}).get('rateLimit'))
+        if not data['data'].get('user'):
+            print(f"GitHub user {github_username} not found")
+            return ContributionCalendar(github_username, None, 404)
+        packed = await calendar_store.save_days(github_username, parse_days(data), now.date(), full_synced_on)
+        return ContributionCalendar(github_username, packed, 200)
+    except Exception as e:
+        metrics.inc("errors_total", stage="github_fetch")
+        print(f"Error fetching contribution data for {github_username}: {e}")
+        return ContributionCalendar(github_username, None, 0)
+
+
+_in_flight = {}  # login -> Future, so concurrent checks for the same login share one request
+
+
+async def fetch_calendar(github_username, token):
+    key = github_username.lower()
+    future = _in_flight.get(key)
+    if future is None:
+        future = asyncio.ensure_future(_fetch_calendar(github_username, token))
+        _in_flight[key] = future
+        future.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await future
+
+
+# Fetch calendars for many users at once; concurrency is bounded by the shared HTTP client.
+# `users` is an iterable of (github_username, token); users sharing a login are fetched once,
+# with whichever of their tokens still has quota. Logins with no usable token are left out.
+# Returns {github_username.lower(): ContributionCalendar}
+async def fetch_calendars(users):
+    unique = {}
+    for github_username, token in users:
+        key = github_username.lower()
+        if key not in unique and budget.can_spend(token):
+            unique[key] = (github_username, token)
+
+    keys = list(unique)
+    results = await asyncio.gather(*(fetch_calendar(*unique[key]) for key in keys))
+    return dict(zip(keys, results))
@@ -0,0 +1,87 @@
+import asyncio
+import random
+import importlib.util
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from urllib.parse import urlsplit
+import httpx
+from config import HTTP_TIMEOUT, HTTP_MAX_CONNECTIONS, HTTP_PER_HOST_LIMIT, HTTP_MAX_RETRIES, HTTP_MAX_RETRY_WAIT
+
+# Shared async HTTP layer: one keep-alive connection pool for the whole bot
+RETRY_BASE_DELAY = 0.5
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+_client = None
+_host_limits = {}
+
+
+def get_client():
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=HTTP2_AVAILABLE,
+            timeout=httpx.Timeout(HTTP_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_CONNECTIONS,
+            ),
+        )
+    return _client
+
+
+def _host_limit(url):
+    host = urlsplit(url).netloc
+    if host not in _host_limits:
+        _host_limits[host] = asyncio.Semaphore(HTTP_PER_HOST_LIMIT)
+    return _host_limits[host]
+
+
+# Seconds to wait from a Retry-After header (either delta-seconds or an HTTP date)
+def _retry_after(response):
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return None
+
+
+# Exponential backoff with full jitter
+def _backoff(attempt):
+    return random.uniform(0, RETRY_BASE_DELAY * (2 ** attempt))
+
+
+# Send a request through the shared pool, retrying transport errors and 429/5xx responses
+async def request(method, url, retries=HTTP_MAX_RETRIES, **kwargs):
+    limit = _host_limit(url)
+    for attempt in range(retries + 1):
+        try:
+            async with limit:
+                response = await get_client().request(method, url, **kwargs)
+        except httpx.TransportError:
+            if attempt == retries:
+                raise
+            delay = _backoff(attempt)
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == retries:
+                return response
+            delay = _retry_after(response)
+            if delay is None:
+                delay = _backoff(attempt)
+            elif delay > HTTP_MAX_RETRY_WAIT:
+                return response
+        await asyncio.sleep(delay)
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+    _host_limits.clear()
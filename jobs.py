@@ -0,0 +1,35 @@
+import asyncio
+import time
+import db
+import metrics
+
+# Periodic jobs whose next run time is kept in the `jobs` table, so restarts don't reset their countdown
+
+
+def _seconds_until(row, now):
+    now = time.time() if now is None else now
+    return 0.0 if row is None else max(0.0, row[0] - now)
+
+
+def seconds_until_due(name, now=None):
+    return _seconds_until(db.query_one("SELECT next_run_at FROM jobs WHERE name = ?", (name,)), now)
+
+
+async def aseconds_until_due(name, now=None):
+    return _seconds_until(await db.aquery_one("SELECT next_run_at FROM jobs WHERE name = ?", (name,)), now)
+
+
+def mark_run(name, interval):
+    db.submit("INSERT OR REPLACE INTO jobs (name, next_run_at) VALUES (?, ?)", (name, time.time() + interval))
+
+
+# Run `job()` every `interval` seconds of wall-clock time, surviving restarts
+async def run_periodic(name, interval, job):
+    while True:
+        await asyncio.sleep(await aseconds_until_due(name))
+        try:
+            await job()
+        except Exception as e:
+            metrics.inc("errors_total", stage=name)
+            print(f"Error running job '{name}': {e}")
+        mark_run(name, interval)
@@ -0,0 +1,191 @@
+import asyncio
+import time
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+import db
+import escalation
+from config import LEADERBOARD_SIZE, LEADERBOARD_FOLLOW_INTERVAL
+
+# Group chat leaderboards. Every check stores the user's latest result (today's count,
+# current streak, this week's total) in `user_stats`; members joined to a group with
+# /join are ranked from those rows, never from fresh calendar fetches.
+
+# Ranking orders for /leaderboard: sort by one column, then the others
+ORDERS = {
+    "today": lambda row: (row.today, row.streak, row.week),
+    "streak": lambda row: (row.streak, row.today, row.week),
+    "week": lambda row: (row.week, row.today, row.streak),
+}
+DEFAULT_ORDER = "today"
+FOLLOW_OVERLAP = 30  # Seconds re-read by follow(); batched writes can land after a later poll
+
+Stats = namedtuple("Stats", "github_username timezone day count streak week")  # As of `day`, the user's local date
+Row = namedtuple("Row", "user_id github_username today streak week")  # As of now
+
+
+# Values as of `today`: a count only holds on its own day, a streak survives until the end
+# of the day after its last contribution, and a week total until the week ends
+def current(stats, today):
+    day = date.fromisoformat(stats.day)
+    if day == today:
+        return stats.count, stats.streak, stats.week
+    streak = stats.streak if day == today - timedelta(days=1) and stats.count else 0
+    same_week = (today - day).days < 7 and (today.weekday() + 1) % 7 >= (day.weekday() + 1) % 7
+    return 0, streak, stats.week if same_week else 0
+
+
+class _Group:
+    __slots__ = ("rows", "ranked", "expires_at")
+
+    def __init__(self):
+        self.rows = {}  # user_id -> Row of members with stats
+        self.ranked = {}  # order -> (rows sorted best first, {user_id: rank})
+        self.expires_at = float("inf")  # A member's local day ends; every row is recomputed
+
+
+class Leaderboards:
+    """
+    Rankings for the group chats that have members.
+
+    Stats of group members are kept in memory, along with each group's
+    current rows. A new check result replaces just that member's row in
+    their groups; rankings are sorted again on the next read, so repeated
+    /leaderboard commands are a dictionary lookup.
+    """
+
+    def __init__(self):
+        self._members = {}  # group_id -> set of user_ids
+        self._groups_of = {}  # user_id -> set of group_ids
+        self._stats = {}  # user_id -> Stats, for group members only
+        self._groups = {}  # group_id -> _Group, built on first read
+        self._days = {}  # timezone name -> (local date, when it ends)
+        self._followed_to = 0.0
+
+    async def load(self):
+        self._members, self._groups_of, self._stats, self._groups = {}, {}, {}, {}
+        for group_id, user_id in await db.aquery("SELECT group_id, user_id FROM group_members"):
+            self._members.setdefault(group_id, set()).add(user_id)
+            self._groups_of.setdefault(user_id, set()).add(group_id)
+        rows = await db.aquery("""
+            SELECT user_id, github_username, timezone, day, count, streak, week, updated_at FROM user_stats
+            WHERE user_id IN (SELECT user_id FROM group_members)
+        """)
+        for user_id, *stats, updated_at in rows:
+            self._stats[user_id] = Stats(*stats)
+            self._followed_to = max(self._followed_to, updated_at)
+
+    def _today(self, timezone, now):
+        day = self._days.get(timezone)
+        if day is None or now >= day[1]:
+            tz = escalation.get_timezone(timezone)
+            day = self._days[timezone] = (datetime.fromtimestamp(now, tz).date(), now + escalation.seconds_left_today(tz, now))
+        return day
+
+    # Put a member's current row (or its absence) into one group
+    def _update_row(self, group, user_id, now):
+        stats = self._stats.get(user_id)
+        if stats is None:
+            group.rows.pop(user_id, None)
+        else:
+            today, ends_at = self._today(stats.timezone, now)
+            group.rows[user_id] = Row(user_id, stats.github_username, *current(stats, today))
+            group.expires_at = min(group.expires_at, ends_at)
+        group.ranked.clear()
+
+    def _refresh(self, user_id, group_ids=None):
+        now = time.time()
+        for group_id in self._groups_of.get(user_id, ()) if group_ids is None else group_ids:
+            group = self._groups.get(group_id)
+            if group is not None:
+                self._update_row(group, user_id, now)
+
+    def _apply(self, user_id, stats):
+        if user_id in self._groups_of and self._stats.get(user_id) != stats:
+            self._stats[user_id] = stats
+            self._refresh(user_id)
+
+    # Store a check result; `packed` is the user's PackedCalendar and `today` their local date
+    def record(self, user_id, github_username, timezone, today, packed):
+        stats = Stats(github_username, timezone, today.isoformat(), packed.count_on(today), packed.streak_as_of(today), packed.week_total(today))
+        db.submit(
+            "INSERT OR REPLACE INTO user_stats (user_id, github_username, timezone, day, count, streak, week, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (user_id, *stats, time.time()),
+        )
+        self._apply(user_id, stats)
+
+    # Add a registered user to a group's board; returns False if they have no GitHub account set
+    async def join(self, group_id, user_id):
+        if not await db.aquery_one("SELECT 1 FROM users WHERE id = ?", (user_id,)):
+            return False
+        await db.write("INSERT OR IGNORE INTO group_members (group_id, user_id) VALUES (?, ?)", (group_id, user_id))
+        row = await db.aquery_one(
+            "SELECT github_username, timezone, day, count, streak, week FROM user_stats WHERE user_id = ?", (user_id,)
+        )
+        self._members.setdefault(group_id, set()).add(user_id)
+        self._groups_of.setdefault(user_id, set()).add(group_id)
+        if row:
+            self._stats[user_id] = Stats(*row)
+        self._refresh(user_id, [group_id])
+        return True
+
+    async def leave(self, group_id, user_id):
+        await db.write("DELETE FROM group_members WHERE group_id = ? AND user_id = ?", (group_id, user_id))
+        self._members.get(group_id, set()).discard(user_id)
+        group = self._groups.get(group_id)
+        if group is not None and group.rows.pop(user_id, None):
+            group.ranked.clear()
+        groups = self._groups_of.get(user_id, set())
+        groups.discard(group_id)
+        if not groups:
+            self._groups_of.pop(user_id, None)
+            self._stats.pop(user_id, None)
+
+    def _group(self, group_id, now):
+        group = self._groups.get(group_id)
+        if group is None or now >= group.expires_at:
+            group = self._groups[group_id] = _Group()
+            for user_id in self._members.get(group_id, ()):
+                self._update_row(group, user_id, now)
+        return group
+
+    # (rows sorted best first, {user_id: rank}) for a group
+    def board(self, group_id, order=DEFAULT_ORDER, now=None):
+        group = self._group(group_id, time.time() if now is None else now)
+        ranked = group.ranked.get(order)
+        if ranked is None:
+            rows = sorted(group.rows.values(), key=ORDERS[order], reverse=True)
+            ranked = group.ranked[order] = (rows, {row.user_id: rank for rank, row in enumerate(rows, 1)})
+        return ranked
+
+    # The /leaderboard reply: the top LEADERBOARD_SIZE, plus the asking user's own place
+    def text(self, group_id, user_id, order=DEFAULT_ORDER, now=None):
+        rows, ranks = self.board(group_id, order, now)
+        if not rows:
+            return "No one here is on the leaderboard yet. Send /join to take part!"
+
+        lines = [f"🏆 Leaderboard by {order}"]
+        lines += [_line(rank, row) for rank, row in enumerate(rows[:LEADERBOARD_SIZE], 1)]
+        rank = ranks.get(user_id)
+        if rank and rank > LEADERBOARD_SIZE:
+            lines += ["…", _line(rank, rows[rank - 1])]
+        return "\n".join(lines)
+
+    # Bot process in sharded mode: pick up results the shard workers stored, a few seconds behind
+    async def follow(self, interval=LEADERBOARD_FOLLOW_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                rows = await db.aquery("""
+                    SELECT user_id, github_username, timezone, day, count, streak, week, updated_at FROM user_stats
+                    WHERE updated_at > ? AND user_id IN (SELECT user_id FROM group_members)
+                """, (self._followed_to - FOLLOW_OVERLAP,))
+                for user_id, *stats, updated_at in rows:
+                    self._apply(user_id, Stats(*stats))
+                    self._followed_to = max(self._followed_to, updated_at)
+            except Exception as e:
+                print(f"Error following leaderboard stats: {e}")
+
+
+def _line(rank, row):
+    return f"{rank}. {row.github_username}: {row.today} today · {row.streak}-day streak · {row.week} this week"
@@ -0,0 +1,156 @@
+import asyncio
+import db
+import metrics
+import stages
+from config import POOL_TARGET, POOL_REFILL_INTERVAL
+from sampler import WeightedSampler, rating_weight
+
+TIERS = ["gentle", "medium", "harsh"]
+USERNAME_PLACEHOLDER = "{username}"
+PROMPT_NAME = "USERNAME"  # Name given to the AI, swapped for the placeholder afterwards
+REFILL_RETRY_DELAY = 60
+
+PROMPTS = {
+    "gentle": f"Generate a gentle notification for a GitHub user named {PROMPT_NAME} to encourage them to code. Keep the tone friendly and motivational. No more than 10 words.",
+    "medium": f"Generate a moderate notification for a GitHub user named {PROMPT_NAME} to encourage them to code. Keep the tone more direct but friendly. No more than 10 words.",
+    "harsh": f"Generate a harsh notification for a GitHub user named {PROMPT_NAME} to encourage them to code. Be assertive and urgent. No more than 10 words.",
+}
+
+
+def render_template(template, username):
+    return template.replace(USERNAME_PLACEHOLDER, username)
+
+
+class MessagePool:
+    """
+    Ready-made notification messages per harshness tier.
+
+    Messages live in the `notifications` table as templates with a
+    {username} placeholder. Lookups are served from memory, weighted by
+    rating through a per-tier WeightedSampler; a background
+    task tops each tier up to `target` messages using a single AI client
+    on the "ai" stage's thread, so the event loop never waits for the AI.
+    """
+
+    def __init__(self, target=POOL_TARGET, refill_interval=POOL_REFILL_INTERVAL):
+        self.target = target
+        self.refill_interval = refill_interval
+        self._samplers = {tier: WeightedSampler() for tier in TIERS}  # tier -> sampler over notification ids
+        self._templates = {}  # notification id -> (tier, template)
+        self._client = None
+        self._wakeup = None
+        self._task = None
+
+    async def load(self):
+        rows = await db.aquery("SELECT id, category, message, rating FROM notifications")
+        self._samplers = {tier: WeightedSampler(max(64, len(rows))) for tier in TIERS}
+        self._templates = {}
+        for notification_id, category, message, rating in rows:
+            self._add(notification_id, category, message, rating)
+
+    def _add(self, notification_id, tier, template, rating=0):
+        if tier in self._samplers:
+            self._samplers[tier].set(notification_id, rating_weight(rating))
+            self._templates[notification_id] = (tier, template)
+
+    def size(self, tier):
+        return len(self._samplers.get(tier, ()))
+
+    # Local lookup for the hot path: (notification id, message) or None if the tier is empty
+    def get_message(self, tier, username):
+        sampler = self._samplers.get(tier)
+        notification_id = sampler.sample() if sampler else None
+        if notification_id is None:
+            self.request_refill()
+            return None
+        return notification_id, render_template(self._templates[notification_id][1], username)
+
+    # Keep the sampler in step with a rating change already written to the database
+    def set_rating(self, notification_id, rating):
+        entry = self._templates.get(notification_id)
+        if entry:
+            self._samplers[entry[0]].set(notification_id, rating_weight(rating))
+
+    # Forget pruned messages; returns the tiers that lost messages
+    def remove(self, notification_ids):
+        tiers = set()
+        for notification_id in notification_ids:
+            entry = self._templates.pop(notification_id, None)
+            if entry:
+                self._samplers[entry[0]].remove(notification_id)
+                tiers.add(entry[0])
+        return tiers
+
+    # Runs on the "ai" stage's thread. The AI client is imported and connected on first use.
+    def _connect(self):
+        if self._client is None:
+            from meta_ai_api import MetaAI
+            self._client = MetaAI()
+        return self._client
+
+    # Connect the AI client ahead of the first refill
+    async def warm_up(self):
+        await stages.run("ai", self._connect)
+
+    # Runs on the "ai" stage's thread
+    def _generate(self, tier):
+        self._connect()
+        with metrics.timed("ai_generation"):
+            response = self._client.prompt(message=PROMPTS[tier])
+        message = response['message'].strip()
+        return message.replace(PROMPT_NAME, USERNAME_PLACEHOLDER) if message else None
+
+    async def _store(self, tier, templates):
+        results = await asyncio.gather(*(
+            db.submit("INSERT INTO notifications (category, message) VALUES (?, ?)", (tier, template))
+            for template in templates
+        ))
+        for result, template in zip(results, templates):
+            self._add(result.lastrowid, tier, template)
+
+    # Top up the given tiers; returns False if the AI failed along the way
+    async def refill(self, tiers=TIERS):
+        ok = True
+        for tier in tiers:
+            missing = self.target - self.size(tier)
+            templates = []
+            for _ in range(max(0, missing)):
+                try:
+                    template = await stages.run("ai", self._generate, tier)
+                except Exception as e:
+                    metrics.inc("errors_total", stage="ai_generation")
+                    print(f"Error generating notification message for category '{tier}': {e}")
+                    ok = False
+                    break
+                if template:
+                    templates.append(template)
+            if templates:
+                await self._store(tier, templates)
+                print(f"Added {len(templates)} '{tier}' message(s) to the pool")
+        return ok
+
+    def request_refill(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            if not await self.refill():
+                await asyncio.sleep(REFILL_RETRY_DELAY)  # Don't hammer a failing AI on every empty lookup
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.refill_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+        for tier in TIERS:
+            metrics.gauge(f"pool_messages_{tier}", f"Ready '{tier}' messages", lambda tier=tier: self.size(tier))
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
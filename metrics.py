@@ -0,0 +1,152 @@
+import asyncio
+import cProfile
+import os
+import threading
+import time
+from contextlib import contextmanager
+from config import METRICS_HOST, METRICS_PORT, PROFILE_CYCLES, PROFILE_DIR
+
+# In-process metrics for the monitoring pipeline, served as Prometheus text on
+# http://METRICS_HOST:METRICS_PORT/metrics.
+#  - Stage timings (db_lookup, github_fetch, render, ai_generation, telegram_send, ...) are histograms.
+#  - Errors and rate-limit hits are counters.
+#  - Gauges (queue depths, event-loop lag) are read when the endpoint is scraped.
+
+PREFIX = "motibot"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Seconds
+LOOP_LAG_INTERVAL = 0.5
+
+_lock = threading.Lock()  # Some stages run on executor threads (AI generation)
+_histograms = {}  # stage -> [count per bucket..., +Inf count, sum]
+_counters = {}  # (name, ((label, value), ...)) -> value
+_gauges = {}  # name -> (help, callable)
+_loop_lag = 0.0
+_profiles_left = PROFILE_CYCLES
+_profiling = False
+
+
+def observe(stage, seconds):
+    with _lock:
+        histogram = _histograms.get(stage)
+        if histogram is None:
+            histogram = _histograms[stage] = [0] * (len(BUCKETS) + 2)
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[i] += 1
+        histogram[-2] += 1
+        histogram[-1] += seconds
+
+
+# Time the enclosed block as `stage`; works around awaits too (wall-clock time)
+@contextmanager
+def timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def inc(name, value=1, **labels):
+    key = (name, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+# Register a gauge read at scrape time, e.g. gauge("send_queue_depth", "...", send_queue.depth)
+def gauge(name, help_text, read):
+    _gauges[name] = (help_text, read)
+
+
+def _labels(pairs):
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}" if pairs else ""
+
+
+def render():
+    lines = [f"# HELP {PREFIX}_stage_seconds Time spent per pipeline stage", f"# TYPE {PREFIX}_stage_seconds histogram"]
+    with _lock:
+        histograms = {stage: list(values) for stage, values in _histograms.items()}
+        counters = dict(_counters)
+    for stage, values in sorted(histograms.items()):
+        for bound, count in zip(BUCKETS, values):
+            lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'{PREFIX}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {values[-2]}')
+        lines.append(f'{PREFIX}_stage_seconds_sum{{stage="{stage}"}} {values[-1]:.6f}')
+        lines.append(f'{PREFIX}_stage_seconds_count{{stage="{stage}"}} {values[-2]}')
+
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# TYPE {PREFIX}_{name} counter")
+        for (counter, labels), value in sorted(counters.items()):
+            if counter == name:
+                lines.append(f"{PREFIX}_{name}{_labels(labels)} {value}")
+
+    gauges = dict(_gauges, event_loop_lag_seconds=("Delay of a periodic wakeup on the event loop", lambda: _loop_lag))
+    for name, (help_text, read) in sorted(gauges.items()):
+        try:
+            value = read()
+        except Exception as e:
+            print(f"Error reading gauge {name}: {e}")
+            continue
+        lines += [f"# HELP {PREFIX}_{name} {help_text}", f"# TYPE {PREFIX}_{name} gauge", f"{PREFIX}_{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+# How late the event loop wakes up from a short sleep; blocking calls show up here
+async def watch_loop_lag(interval=LOOP_LAG_INTERVAL):
+    global _loop_lag
+    while True:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        _loop_lag = time.perf_counter() - started - interval
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+            pass  # Headers are not needed
+        parts = request_line.split()
+        if len(parts) >= 2 and parts[0] == b"GET" and parts[1].split(b"?")[0] == b"/metrics":
+            status, body = "200 OK", render().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    finally:
+        writer.close()
+
+
+# Serve /metrics until cancelled; run it as a background task
+async def serve(host=METRICS_HOST, port=METRICS_PORT):
+    server = await asyncio.start_server(_handle, host, port)
+    print(f"Metrics on http://{host}:{port}/metrics")
+    async with server:
+        await server.serve_forever()
+
+
+# cProfile the enclosed block for the first PROFILE_CYCLES cycles, dumping a .prof file per
+# cycle into PROFILE_DIR. The profiler sees everything the thread runs meanwhile, including
+# other coroutines, so blocks that overlap a running profile are not profiled themselves.
+@contextmanager
+def profiled(name):
+    global _profiles_left, _profiling
+    if _profiles_left <= 0 or _profiling:
+        yield
+        return
+
+    _profiles_left -= 1
+    _profiling = True
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        _profiling = False
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{_profiles_left}.prof")
+        profile.dump_stats(path)
+        print(f"Profile written to {path}")
@@ -0,0 +1,220 @@
+import sys
+from array import array
+from datetime import date, timedelta
+
+WEEKS = 53
+DAYS = WEEKS * 7  # Cells in the contribution graph
+MAX_COUNT = 0xFFFF  # Counts are stored as uint16
+LEVELS = 4  # Contribution levels above "none", like GitHub's graph
+INCREMENTAL_MERGE_DAYS = 7  # Larger merges rebuild the summary once instead of updating it per day
+
+
+# First day of the graph: the Sunday that starts the oldest of the 53 week columns, like GitHub's calendar
+def calendar_start(today):
+    this_sunday = today - timedelta(days=(today.weekday() + 1) % 7)
+    return this_sunday - timedelta(weeks=WEEKS - 1)
+
+
+class PackedCalendar:
+    """
+    53 weeks of daily contribution counts in one packed uint16 array.
+
+    The window starts on a Sunday and runs through today. Weekly totals,
+    streaks and each day's palette level are updated as days change, so
+    messages and rendering never rebuild or rescan lists. Streaks only need
+    a rescan of the window when a day other than today changes. Serializes
+    to a BLOB for the calendar store.
+    """
+
+    __slots__ = ("start", "length", "counts", "weekly", "total", "current_streak", "longest_streak",
+                 "_histogram", "_thresholds", "_levels", "_run_before_today")
+
+    def __init__(self, start, length, counts=None):
+        self.start = start
+        self.length = length  # Days from start through today
+        self.counts = counts if counts is not None else array('H', bytes(2 * DAYS))
+        self._rebuild()
+
+    @classmethod
+    def empty(cls, today):
+        start = calendar_start(today)
+        return cls(start, (today - start).days + 1)
+
+    @classmethod
+    def from_blob(cls, start, blob, today):
+        counts = array('H')
+        counts.frombytes(blob)
+        if len(counts) != DAYS:
+            return cls.empty(today)
+        if sys.byteorder == 'big':
+            counts.byteswap()  # Stored little-endian
+        calendar = cls.__new__(cls)
+        calendar.start, calendar.counts, calendar.length = date.fromisoformat(start), counts, None  # Summary built by rebase()
+        return calendar.rebase(today)
+
+    def to_blob(self):
+        counts = array('H', self.counts)
+        if sys.byteorder == 'big':
+            counts.byteswap()
+        return counts.tobytes()
+
+    # Move the window so it ends today, dropping whole weeks that fell off the graph.
+    # A window that already ends today is left as it is, summary included.
+    def rebase(self, today):
+        start = calendar_start(today)
+        shift = (start - self.start).days
+        length = min(DAYS, (today - start).days + 1)
+        if not shift and length == self.length:
+            return self
+        if shift:
+            kept = self.counts[shift:] if 0 < shift < DAYS else array('H')  # A later start (clock went back) starts over
+            self.counts = kept + array('H', bytes(2 * (DAYS - len(kept))))
+            self.start = start
+        self.length = length
+        for i in range(self.length, DAYS):
+            self.counts[i] = 0
+        self._rebuild()
+        return self
+
+    def _index(self, day):
+        i = (day - self.start).days
+        return i if 0 <= i < self.length else None
+
+    def count_on(self, day):
+        i = self._index(day)
+        return self.counts[i] if i is not None else 0
+
+    # The streak as seen on `day`, a user's local date, which can be a day off the window's last
+    # day: the run of active days ending on `day`, or on the day before while `day` has none yet
+    def streak_as_of(self, day):
+        i = (day - self.start).days
+        if not 0 <= i < self.length or not self.counts[i]:
+            i -= 1
+        run = 0
+        while 0 <= i < self.length and self.counts[i]:
+            run += 1
+            i -= 1
+        return run
+
+    # Contributions in the Sunday-to-Saturday week holding `day`, up to the end of the window
+    def week_total(self, day):
+        i = self._index(day)
+        return self.weekly[i // 7] if i is not None else 0
+
+    # (day 'YYYY-MM-DD', count) for every day in the window, oldest first
+    def days(self):
+        for i in range(self.length):
+            yield (self.start + timedelta(days=i)).isoformat(), self.counts[i]
+
+    # Counts as a list of weeks, Sunday first
+    @property
+    def activity(self):
+        counts = self.counts[:self.length].tolist()
+        return [counts[i:i + 7] for i in range(0, len(counts), 7)]
+
+    # Palette index per graph cell: 1 + level for days in the window, 0 (background) after today
+    def levels(self):
+        return bytes(self._levels)
+
+    # Merge fetched (day 'YYYY-MM-DD', count) pairs; days outside the window are ignored.
+    # Deltas of a few days are applied incrementally, a full year in one pass and a rebuild.
+    def merge(self, days):
+        days = list(days)
+        if len(days) <= INCREMENTAL_MERGE_DAYS:
+            for day, count in days:
+                self.set(date.fromisoformat(day[:10]), count)
+            return self
+        for day, count in days:
+            i = self._index(date.fromisoformat(day[:10]))
+            if i is not None:
+                self.counts[i] = min(max(count, 0), MAX_COUNT)
+        self._rebuild()
+        return self
+
+    def set(self, day, count):
+        i = self._index(day)
+        if i is None:
+            return
+        count = min(max(count, 0), MAX_COUNT)
+        old = self.counts[i]
+        if count == old:
+            return
+        self.counts[i] = count
+        self.weekly[i // 7] += count - old
+        self.total += count - old
+
+        self._count_day(old, -1)
+        self._count_day(count, 1)
+        thresholds = self._quartiles()
+        if thresholds != self._thresholds:
+            self._thresholds = thresholds
+            self._refresh_levels()
+        else:
+            self._levels[i] = 1 + self._level(count)
+
+        if i == self.length - 1 and (count > 0) == (old > 0):
+            return  # Today's count changed but not whether there was one
+        if i == self.length - 1 and count > 0:
+            self.current_streak = self._run_before_today + 1
+            self.longest_streak = max(self.longest_streak, self.current_streak)
+        else:
+            self._rescan_streaks()
+
+    def _count_day(self, count, delta):
+        if count > 0:
+            remaining = self._histogram.get(count, 0) + delta
+            if remaining:
+                self._histogram[count] = remaining
+            else:
+                del self._histogram[count]
+
+    # Upper bounds of levels 1..3: quartiles of the days with contributions
+    def _quartiles(self):
+        active = sum(self._histogram.values())
+        if not active:
+            return ()
+        targets = [-(-active * k // LEVELS) for k in range(1, LEVELS)]  # ceil(active * k / 4)
+        thresholds, seen = [], 0
+        for count in sorted(self._histogram):
+            seen += self._histogram[count]
+            while targets and seen >= targets[0]:
+                thresholds.append(count)
+                targets.pop(0)
+        return tuple(thresholds)
+
+    def _level(self, count):
+        if count == 0:
+            return 0
+        return 1 + sum(count > threshold for threshold in self._thresholds)
+
+    def _refresh_levels(self):
+        for i in range(self.length):
+            self._levels[i] = 1 + self._level(self.counts[i])
+        for i in range(self.length, DAYS):
+            self._levels[i] = 0
+
+    # The streak counts today once there's a contribution, and stays alive until the day ends
+    def _rescan_streaks(self):
+        run = longest = 0
+        run_before_today = 0
+        for i in range(self.length):
+            if i == self.length - 1:
+                run_before_today = run
+            run = run + 1 if self.counts[i] else 0
+            longest = max(longest, run)
+        self._run_before_today = run_before_today
+        self.current_streak = run if self.length and self.counts[self.length - 1] else run_before_today
+        self.longest_streak = longest
+
+    def _rebuild(self):
+        self.weekly = array('I', [0] * WEEKS)
+        self._histogram = {}
+        for i in range(self.length):
+            count = self.counts[i]
+            self.weekly[i // 7] += count
+            self._count_day(count, 1)
+        self.total = sum(self.weekly)
+        self._thresholds = self._quartiles()
+        self._levels = bytearray(DAYS)
+        self._refresh_levels()
+        self._rescan_streaks()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import db
+from attribution import PENDING
+
+PRUNE_JOB = "prune_notifications"
+PRUNE_INTERVAL = 3 * 86400  # Every 3 days
+PRUNE_FRACTION = 0.15  # Share of each category removed per run
+PRUNE_MIN_KEEP = 5  # Never shrink a category below this
+PRUNE_CHUNK = 50  # Rows deleted per transaction
+DELIVERY_HISTORY = 30 * 86400  # Finished deliveries are kept this long
+
+
+# Lowest-rated messages in a category, read in rating order straight off
+# idx_notifications_category_rating (no sort). Messages with deliveries still
+# waiting for attribution are skipped.
+async def select_victims(category):
+    count = (await db.aquery_one("SELECT COUNT(*) FROM notifications WHERE category = ?", (category,)))[0]
+    limit = min(int(count * PRUNE_FRACTION), count - PRUNE_MIN_KEEP)
+    if limit <= 0:
+        return []
+    rows = await db.aquery(f"""
+        SELECT id FROM notifications INDEXED BY idx_notifications_category_rating
+        WHERE category = ?
+          AND NOT EXISTS (
+              SELECT 1 FROM deliveries
+              WHERE deliveries.notification_id = notifications.id AND deliveries.status = {PENDING}
+          )
+        ORDER BY rating ASC
+        LIMIT ?
+    """, (category, limit))
+    return [row[0] for row in rows]
+
+
+# Delete the least effective messages of every category in small chunks.
+# Returns the categories that lost messages.
+async def prune_notifications(message_pool=None):
+    categories = [row[0] for row in await db.aquery("SELECT DISTINCT category FROM notifications")]
+    pruned = set()
+    for category in categories:
+        victims = await select_victims(category)
+        for start in range(0, len(victims), PRUNE_CHUNK):
+            chunk = victims[start:start + PRUNE_CHUNK]
+            await db.write(
+                f"DELETE FROM notifications WHERE id IN ({','.join('?' * len(chunk))})", chunk,
+            )
+            await asyncio.sleep(0)  # Let queued writes in between chunks
+        if victims:
+            print(f"Pruned {len(victims)} '{category}' notification(s)")
+            pruned.add(category)
+            if message_pool:
+                message_pool.remove(victims)
+
+    await db.write(
+        f"DELETE FROM deliveries WHERE status != {PENDING} AND sent_at < ?",
+        (time.time() - DELIVERY_HISTORY,),
+    )
+    if pruned and message_pool:
+        message_pool.request_refill()
+    return pruned
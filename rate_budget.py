@@ -0,0 +1,102 @@
+import hashlib
+import time
+from dataclasses import dataclass
+from datetime import datetime
+
+GRAPHQL_POINTS_PER_HOUR = 5000  # GitHub's default GraphQL limit per token
+RESERVE_POINTS = 50  # Keep this much quota back for the user's own tools
+
+
+@dataclass
+class TokenQuota:
+    limit: int = GRAPHQL_POINTS_PER_HOUR
+    remaining: int = GRAPHQL_POINTS_PER_HOUR
+    reset_at: float = 0.0  # Epoch seconds when `remaining` goes back to `limit`
+
+
+class RateBudget:
+    """
+    Tracks remaining GitHub quota and reset time per token, from the
+    X-RateLimit-* headers and the GraphQL `rateLimit` field of each response.
+    """
+
+    def __init__(self, reserve=RESERVE_POINTS):
+        self.reserve = reserve
+        self._quotas = {}  # token digest -> TokenQuota
+
+    # Key quotas by a digest so raw tokens aren't kept around in yet another structure
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).hexdigest()[:16]
+
+    def _quota(self, token, now=None):
+        key = self._key(token)
+        self._quotas.setdefault(key, TokenQuota())
+        return self._quota_by_key(key, time.time() if now is None else now)
+
+    def _quota_by_key(self, key, now):
+        quota = self._quotas[key]
+        if quota.reset_at and now >= quota.reset_at:
+            quota.remaining, quota.reset_at = quota.limit, 0.0
+        return quota
+
+    # Update from response headers; call after every GitHub request
+    def record_headers(self, token, status_code, headers):
+        quota = self._quota(token)
+        try:
+            if "X-RateLimit-Limit" in headers:
+                quota.limit = int(headers["X-RateLimit-Limit"])
+            if "X-RateLimit-Remaining" in headers:
+                quota.remaining = int(headers["X-RateLimit-Remaining"])
+            if "X-RateLimit-Reset" in headers:
+                quota.reset_at = float(headers["X-RateLimit-Reset"])
+        except ValueError:
+            pass
+
+        # Secondary limits come back as 403/429 with Retry-After instead of a zero Remaining
+        if status_code in (403, 429) and "Retry-After" in headers:
+            try:
+                quota.remaining = 0
+                quota.reset_at = max(quota.reset_at, time.time() + float(headers["Retry-After"]))
+            except ValueError:
+                pass
+
+    # Update from a GraphQL `rateLimit { limit remaining resetAt }` payload
+    def record_graphql(self, token, rate_limit):
+        if not rate_limit:
+            return
+        quota = self._quota(token)
+        quota.limit = rate_limit.get("limit", quota.limit)
+        quota.remaining = rate_limit.get("remaining", quota.remaining)
+        if rate_limit.get("resetAt"):
+            quota.reset_at = datetime.fromisoformat(rate_limit["resetAt"].replace("Z", "+00:00")).timestamp()
+
+    def is_rate_limited(self, token):
+        return self._quota(token).remaining <= 0
+
+    def can_spend(self, token, cost=1, now=None):
+        return self._quota(token, now).remaining - cost >= self.reserve
+
+    # Reserve quota for a request that is about to be sent
+    def spend(self, token, cost=1):
+        self._quota(token).remaining -= cost
+
+    # Earliest time a request with `cost` points can go out for this token
+    def available_at(self, token, cost=1, now=None):
+        now = time.time() if now is None else now
+        quota = self._quota(token, now)
+        if quota.remaining - cost >= self.reserve:
+            return now
+        return quota.reset_at or now + 3600
+
+    # Fraction of quota left across all known tokens (1.0 = untouched)
+    def headroom(self, now=None):
+        now = time.time() if now is None else now
+        quotas = [self._quota_by_key(key, now) for key in list(self._quotas)]
+        total_limit = sum(quota.limit for quota in quotas)
+        if not total_limit:
+            return 1.0
+        return sum(max(0, quota.remaining) for quota in quotas) / total_limit
+
+
+budget = RateBudget()
@@ -0,0 +1,114 @@
+import hashlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from io import BytesIO
+import numpy as np
+from PIL import Image
+from config import RENDER_CACHE_SIZE
+
+BOX_SIZE, PADDING = 20, 5
+COLS, ROWS = 53, 7
+IMG_WIDTH, IMG_HEIGHT = COLS * (BOX_SIZE + PADDING) + PADDING, ROWS * (BOX_SIZE + PADDING) + PADDING
+COLORS = ["#ebedf0", "#c6e48b", "#7bc96f", "#239a3b", "#196127"]
+
+CELLS = COLS * ROWS
+BACKGROUND = CELLS  # Cell index used for the white padding
+
+
+# Palette: index 0 is the white background, 1.. are the contribution levels
+def _palette():
+    palette = [255, 255, 255]
+    for color in COLORS:
+        palette += [int(color[i:i + 2], 16) for i in (1, 3, 5)]
+    return palette
+
+
+# Which day cell each pixel belongs to (BACKGROUND for padding), computed once.
+# Cells cover [x, x + BOX_SIZE] inclusive, like the ImageDraw.rectangle calls they replace.
+def _cell_map():
+    def axis(size, count):
+        index = np.full(size, -1, dtype=np.int32)
+        for i in range(count):
+            start = PADDING + i * (BOX_SIZE + PADDING)
+            index[start:start + BOX_SIZE + 1] = i
+        return index
+
+    col_of_x = axis(IMG_WIDTH, COLS)
+    row_of_y = axis(IMG_HEIGHT, ROWS)
+    cells = col_of_x[np.newaxis, :] * ROWS + row_of_y[:, np.newaxis]
+    cells[(row_of_y[:, np.newaxis] < 0) | (col_of_x[np.newaxis, :] < 0)] = BACKGROUND
+    return cells
+
+
+PALETTE = _palette()
+CELL_MAP = _cell_map()
+
+
+@dataclass(frozen=True)
+class RenderedGraph:
+    png: bytes
+    digest: str  # Hash of the rendered levels; identical graphs share it
+
+
+# Map daily counts to palette indices (1..len(COLORS)); cells past the last day stay background
+def contribution_levels(daily_contributions):
+    counts = np.asarray(list(daily_contributions)[:CELLS], dtype=np.int64)
+    levels = np.zeros(CELLS, dtype=np.uint8)
+    levels[:len(counts)] = np.clip(counts, 0, len(COLORS) - 1) + 1
+    return levels
+
+
+def _encode(levels):
+    lookup = np.append(levels, np.uint8(0))  # BACKGROUND -> palette index 0
+    image = Image.frombytes("P", (IMG_WIDTH, IMG_HEIGHT), lookup[CELL_MAP].tobytes())
+    image.putpalette(PALETTE)
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+# PNG bytes for one palette index per cell (a PackedCalendar's levels()); the render
+# processes run this, so it takes and returns plain bytes
+def encode_levels(levels):
+    return _encode(np.frombuffer(bytes(levels), dtype=np.uint8))
+
+
+_cache = OrderedDict()  # digest -> RenderedGraph, least recently used first
+
+
+def _digest(levels):
+    return hashlib.sha1(bytes(levels)).hexdigest()
+
+
+# The cached graph for these levels, or None
+def cached_graph(levels):
+    graph = _cache.get(_digest(levels))
+    if graph is not None:
+        _cache.move_to_end(graph.digest)
+    return graph
+
+
+# Cache PNG bytes rendered elsewhere (a render process) for these levels
+def cache_graph(levels, png):
+    graph = RenderedGraph(png, _digest(levels))
+    _cache[graph.digest] = graph
+    if len(_cache) > RENDER_CACHE_SIZE:
+        _cache.popitem(last=False)
+    return graph
+
+
+# Render levels in this process; unchanged graphs are served from the cache
+def render_levels(levels):
+    return cached_graph(levels) or cache_graph(levels, encode_levels(levels))
+
+
+def render_contribution_graph(daily_contributions):
+    return render_levels(contribution_levels(daily_contributions))
+
+
+def empty_levels():
+    return bytes(contribution_levels([0] * CELLS))
+
+
+def render_empty_contribution_graph():
+    return render_levels(empty_levels())
@@ -0,0 +1,50 @@
+import asyncio
+import os
+import time
+from config import IMAGE_PATH, IMAGE_MAX_AGE, IMAGE_MAX_BYTES, IMAGE_SWEEP_INTERVAL
+
+
+# One pass over the image directory: delete files older than `max_age`, then the
+# oldest remaining files until the directory fits in `max_bytes`.
+# Returns (files deleted, bytes left).
+def sweep_images(path=IMAGE_PATH, max_age=IMAGE_MAX_AGE, max_bytes=IMAGE_MAX_BYTES, now=None):
+    now = time.time() if now is None else now
+    files = []
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    stat = entry.stat(follow_symlinks=False)
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+    except FileNotFoundError:
+        return 0, 0
+
+    files.sort()  # Oldest first
+    total = sum(size for _, size, _ in files)
+    deleted = 0
+    for mtime, size, file_path in files:
+        if mtime >= now - max_age and total <= max_bytes:
+            break
+        try:
+            os.remove(file_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error deleting {file_path}: {e}")
+            continue
+        total -= size
+        deleted += 1
+
+    if deleted:
+        print(f"Deleted {deleted} old image(s) from {path}")
+    return deleted, total
+
+
+# Sweep at startup (cleaning up after earlier runs) and then every `interval` seconds
+async def run_sweeper(interval=IMAGE_SWEEP_INTERVAL):
+    while True:
+        try:
+            await asyncio.to_thread(sweep_images)
+        except Exception as e:
+            print(f"Error sweeping images: {e}")
+        await asyncio.sleep(interval)
@@ -0,0 +1,115 @@
+import random
+
+
+# Selection weight for a notification rating: every message stays pickable, better ones more often
+def rating_weight(rating):
+    return 1 + max(rating, 0)
+
+
+class WeightedSampler:
+    """
+    Weighted random choice over keys in O(log n), backed by a Fenwick tree.
+
+    Adding, reweighting and removing a key are O(log n) too, so ratings can
+    change without rebuilding anything.
+    """
+
+    def __init__(self, capacity=64):
+        self._tree = [0] * (capacity + 1)  # 1-based Fenwick tree of weights
+        self._weights = [0] * capacity
+        self._keys = [None] * capacity
+        self._slots = {}  # key -> slot
+        self._free = list(range(capacity - 1, -1, -1))
+        self.total = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, key):
+        return key in self._slots
+
+    def _add(self, slot, delta):
+        self.total += delta
+        i = slot + 1
+        while i < len(self._tree):
+            self._tree[i] += delta
+            i += i & -i
+
+    def _grow(self):
+        old_keys, old_weights = self._keys, self._weights
+        capacity = len(old_keys) * 2
+        self._tree = [0] * (capacity + 1)
+        self._weights = [0] * capacity
+        self._keys = [None] * capacity
+        self._slots = {}
+        self._free = list(range(capacity - 1, -1, -1))
+        self.total = 0
+        for key, weight in zip(old_keys, old_weights):
+            if key is not None:
+                self.set(key, weight)
+
+    # Add a key or change its weight
+    def set(self, key, weight):
+        slot = self._slots.get(key)
+        if slot is None:
+            if not self._free:
+                self._grow()
+            slot = self._free.pop()
+            self._slots[key] = slot
+            self._keys[slot] = key
+        self._add(slot, weight - self._weights[slot])
+        self._weights[slot] = weight
+
+    def remove(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        self._add(slot, -self._weights[slot])
+        self._weights[slot] = 0
+        self._keys[slot] = None
+        self._free.append(slot)
+
+    def sample(self, rng=random):
+        if self.total <= 0:
+            return None
+        target = rng.random() * self.total
+        # Walk down the tree to the first slot whose prefix sum exceeds target
+        position = 0
+        step = 1 << (len(self._tree) - 1).bit_length()
+        while step:
+            nxt = position + step
+            if nxt < len(self._tree) and self._tree[nxt] <= target:
+                position = nxt
+                target -= self._tree[nxt]
+            step >>= 1
+        return self._keys[min(position, len(self._keys) - 1)]
+
+
+# SQL fallback for when no in-memory sampler has the category (a fresh database, a worker's copy
+# that hasn't caught up, or test6.py). Every step is a seek on idx_notifications_category_rating
+# or the rowid, so it stays O(log n): pick a rating skewed towards the top, take the first rating
+# at or above it, then the first message of that rating from a random id onwards.
+FALLBACK_BOUNDS_SQL = """
+    SELECT (SELECT MIN(rating) FROM notifications WHERE category = ?),
+           (SELECT MAX(rating) FROM notifications WHERE category = ?),
+           (SELECT MIN(id) FROM notifications),
+           (SELECT MAX(id) FROM notifications)
+"""
+FALLBACK_PICK_SQL = """
+    SELECT id, message FROM notifications
+    WHERE category = ? AND id >= ?
+      AND rating = (SELECT rating FROM notifications WHERE category = ? AND rating >= ? ORDER BY rating LIMIT 1)
+    ORDER BY id LIMIT 1
+"""
+
+
+# Parameters for FALLBACK_PICK_SQL to try in turn, given the FALLBACK_BOUNDS_SQL row; the
+# first one returning a row is the pick. Empty when the category has no messages.
+def fallback_picks(category, bounds, rng=random):
+    low, high, first_id, last_id = bounds
+    if low is None:
+        return []
+    target = high - int((high - low + 1) * rng.random() ** 2)  # Skewed towards the top-rated end
+    pivot = rng.randint(first_id, last_id)
+    # Wrap around when nothing of that rating follows the pivot
+    return [(category, start_id, category, target) for start_id in (pivot, first_id)]
@@ -0,0 +1,155 @@
+import asyncio
+import heapq
+import time
+import db
+import metrics
+from sharding import shard_filter
+from config import CHECK_INTERVAL, SCHEDULER_BATCH_SIZE, SCHEDULER_WORKERS
+
+LOAD_PAGE_SIZE = 5000  # Users read per query while the schedule loads
+
+
+class Scheduler:
+    """
+    Single scheduler for all monitored users.
+
+    Next-check times live in a min-heap and in the `schedule` table, so the
+    schedule survives restarts. Due users are dispatched in batches to a
+    fixed number of workers that call `check_batch(user_ids)`, which may
+    return {user_id: next_check_at} to override the regular interval.
+    """
+
+    def __init__(self, check_batch, interval=CHECK_INTERVAL, batch_size=SCHEDULER_BATCH_SIZE, workers=SCHEDULER_WORKERS):
+        self.check_batch = check_batch
+        self.interval = interval
+        self.batch_size = batch_size
+        self.workers = workers
+        self._heap = []  # (next_check_at, user_id); stale entries are skipped on pop
+        self._due = {}  # user_id -> next_check_at, the live entry for each user
+        self._checking = set()  # Users popped for a check that hasn't finished yet
+        self._queue = None  # Created in start() so they bind to the running loop
+        self._wakeup = None
+        self._tasks = []
+
+    # Rebuild the heap from the database, a page of users at a time so startup isn't held up;
+    # users without a schedule row are due now. It can run while the scheduler is already
+    # dispatching: users scheduled or checked in the meantime keep their fresher entry.
+    # A sharded worker passes its shard to load only the users it owns.
+    async def load(self, shard=0, shards=1, page_size=LOAD_PAGE_SIZE):
+        await db.write("DELETE FROM schedule WHERE user_id NOT IN (SELECT id FROM users)")
+        condition, params = shard_filter("users.id", shard, shards)
+        loaded, last_id = 0, -2 ** 63
+        while True:
+            rows = await db.aquery(f"""
+                SELECT users.id, COALESCE(schedule.next_check_at, ?)
+                FROM users LEFT JOIN schedule ON schedule.user_id = users.id
+                WHERE {condition} AND users.id > ?
+                ORDER BY users.id LIMIT ?
+            """, (time.time(), *params, last_id, page_size))
+            if not rows:
+                break
+            for user_id, next_check_at in rows:
+                if user_id not in self._due and user_id not in self._checking:
+                    self._due[user_id] = next_check_at
+                    heapq.heappush(self._heap, (next_check_at, user_id))
+            if self._wakeup is not None:
+                self._wakeup.set()
+            loaded += len(rows)
+            last_id = rows[-1][0]
+        print(f"Scheduler loaded {loaded} user(s)")
+
+    def _persist(self, entries):
+        db.submit("INSERT OR REPLACE INTO schedule (user_id, next_check_at) VALUES (?, ?)", entries, many=True)
+
+    # Schedule (or reschedule) users; `entries` is a list of (user_id, next_check_at)
+    def schedule_many(self, entries):
+        entries = list(entries)
+        if not entries:
+            return
+        self._persist(entries)
+        for user_id, next_check_at in entries:
+            self._due[user_id] = next_check_at
+            heapq.heappush(self._heap, (next_check_at, user_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def schedule(self, user_id, next_check_at=None):
+        self.schedule_many([(user_id, time.time() if next_check_at is None else next_check_at)])
+
+    def unschedule(self, user_id):
+        self._due.pop(user_id, None)
+        db.submit("DELETE FROM schedule WHERE user_id = ?", (user_id,))
+
+    def __len__(self):
+        return len(self._due)
+
+    # Pop up to batch_size users whose check is due
+    def _pop_due(self, now):
+        batch = []
+        while self._heap and len(batch) < self.batch_size:
+            next_check_at, user_id = self._heap[0]
+            if self._due.get(user_id) != next_check_at:
+                heapq.heappop(self._heap)  # Stale entry
+                continue
+            if next_check_at > now:
+                break
+            heapq.heappop(self._heap)
+            del self._due[user_id]  # In progress; rescheduled when the check finishes
+            self._checking.add(user_id)
+            batch.append(user_id)
+        return batch
+
+    def _seconds_until_next(self, now):
+        while self._heap and self._due.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+        if not self._heap:
+            return None
+        return max(0.0, self._heap[0][0] - now)
+
+    async def _dispatch_loop(self):
+        while True:
+            self._wakeup.clear()
+            batch = self._pop_due(time.time())
+            if batch:
+                await self._queue.put(batch)  # Blocks while all workers are busy
+                continue
+
+            timeout = self._seconds_until_next(time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            batch = await self._queue.get()
+            started = time.time()
+            overrides = {}
+            try:
+                with metrics.profiled("check_batch"), metrics.timed("check_batch"):
+                    overrides = await self.check_batch(batch) or {}
+            except Exception as e:
+                metrics.inc("errors_total", stage="check_batch")
+                print(f"Error checking batch of {len(batch)} user(s): {e}")
+            finally:
+                # Users re-registered during the check already have a fresh entry
+                self._checking.difference_update(batch)
+                self.schedule_many(
+                    (user_id, overrides.get(user_id, started + self.interval))
+                    for user_id in batch if user_id not in self._due
+                )
+                self._queue.task_done()
+
+    def start(self):
+        self._queue = asyncio.Queue(maxsize=self.workers)
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._dispatch_loop())]
+        self._tasks += [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        metrics.gauge("scheduled_users", "Users with a planned check", self.__len__)
+        metrics.gauge("scheduler_batches_waiting", "Due batches waiting for a free worker", self._queue.qsize)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,151 @@
+import asyncio
+import multiprocessing
+import time
+import db
+from telegram_sender import PRIORITY_NORMAL
+
+# Sharded worker mode. Each worker process owns the users whose id hashes to its
+# shard and runs their checks (fetch, render, decide) on its own core. Workers
+# never talk to Telegram: messages go back to the bot process through the `outbox`
+# table, and the bot process hands newly registered users to their worker through
+# the `wakeups` table. Both survive a worker restart. The outbox also keeps whatever
+# the send queue couldn't send before a shutdown, in either mode.
+
+OUTBOX_POLL_INTERVAL = 0.5  # Seconds between outbox drains in the bot process
+OUTBOX_BATCH_SIZE = 500  # Messages moved to the send queue per drain
+WAKEUP_POLL_INTERVAL = 1  # Seconds between wakeup checks in a worker
+POOL_SYNC_INTERVAL = 10  # Seconds between checks for pool changes in a worker
+SUPERVISE_INTERVAL = 5  # Seconds between liveness checks of the workers
+WORKER_STOP_TIMEOUT = 15  # Grace period for a worker to flush its writes on shutdown
+
+
+def shard_of(user_id, shards):
+    return user_id % shards
+
+
+# SQL for shard_of(); SQLite's % keeps the sign of negative (group) chat ids
+def shard_filter(column, shard, shards):
+    return f"(({column} % ?) + ?) % ? = ?", (shards, shards, shards, shard)
+
+
+class Outbox:
+    """Worker side of the send queue: same enqueue() as SendQueue, but rows in `outbox`."""
+
+    def enqueue(self, chat_id, text=None, graph=None, priority=PRIORITY_NORMAL):
+        db.submit(
+            "INSERT INTO outbox (chat_id, text, graph, graph_digest, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (chat_id, text, graph.png if graph else None, graph.digest if graph else None, priority, time.time()),
+        )
+
+
+# Bot process: move everything waiting in the outbox into the send queue. Returns the number of messages.
+async def take_outbox(send_queue):
+    from renderer import RenderedGraph  # Loads the imaging stack; only needed once messages arrive
+    taken = 0
+    while await db.aquery_one("SELECT 1 FROM outbox LIMIT 1"):
+        result = await db.write("""
+            DELETE FROM outbox WHERE id IN (SELECT id FROM outbox ORDER BY id LIMIT ?)
+            RETURNING id, chat_id, text, graph, graph_digest, priority
+        """, (OUTBOX_BATCH_SIZE,))
+        for _, chat_id, text, png, digest, priority in sorted(result.rows):
+            graph = RenderedGraph(png, digest) if png is not None else None
+            send_queue.enqueue(chat_id, text=text, graph=graph, priority=priority)
+        taken += len(result.rows)
+        if len(result.rows) < OUTBOX_BATCH_SIZE:
+            break
+    return taken
+
+
+# Bot process: move queued worker messages into the real send queue
+async def drain_outbox(send_queue, interval=OUTBOX_POLL_INTERVAL):
+    while True:
+        try:
+            await take_outbox(send_queue)
+        except Exception as e:
+            print(f"Error draining outbox: {e}")
+        await asyncio.sleep(interval)
+
+
+# Worker: schedule the users the bot process woke up for this shard
+async def poll_wakeups(scheduler, shard, interval=WAKEUP_POLL_INTERVAL):
+    while True:
+        try:
+            if await db.aquery_one("SELECT 1 FROM wakeups WHERE shard = ? LIMIT 1", (shard,)):
+                result = await db.write("DELETE FROM wakeups WHERE shard = ? RETURNING user_id, due_at", (shard,))
+                scheduler.schedule_many(result.rows)
+        except Exception as e:
+            print(f"Error polling wakeups for shard {shard}: {e}")
+        await asyncio.sleep(interval)
+
+
+# Worker: pick up pool messages, ratings and prunes written by the other processes. The pool
+# is reloaded only when the notifications table changed: new rows move MAX(id), prunes
+# change the count, and rating updates change the rating total.
+async def refresh_pool(message_pool, interval=POOL_SYNC_INTERVAL):
+    loaded = None
+    while True:
+        try:
+            version = await db.aquery_one("SELECT COUNT(*), MAX(id), TOTAL(rating) FROM notifications")
+            if version != loaded:
+                await message_pool.load()
+                loaded = version
+        except Exception as e:
+            print(f"Error reloading message pool: {e}")
+        await asyncio.sleep(interval)
+
+
+class ShardRouter:
+    """
+    Stands in for the Scheduler in the bot process when users are sharded.
+
+    schedule() forwards the user to its worker; start() spawns one worker
+    process per shard running `target(shard, shards)` and restarts any that
+    die, without touching the others.
+    """
+
+    def __init__(self, target, shards):
+        self.target = target
+        self.shards = shards
+        self._context = multiprocessing.get_context("spawn")  # Fresh interpreters, no inherited event loop
+        self._processes = [None] * shards
+        self._task = None
+
+    def schedule(self, user_id, next_check_at=None):
+        db.submit(
+            "INSERT INTO wakeups (user_id, shard, due_at) VALUES (?, ?, ?)",
+            (user_id, shard_of(user_id, self.shards), time.time() if next_check_at is None else next_check_at),
+        )
+
+    def _spawn(self, shard):
+        process = self._context.Process(target=self.target, args=(shard, self.shards), name=f"shard-{shard}")
+        process.start()
+        self._processes[shard] = process
+        print(f"Started worker for shard {shard}/{self.shards} (pid {process.pid})")
+
+    async def _supervise(self):
+        while True:
+            await asyncio.sleep(SUPERVISE_INTERVAL)
+            for shard, process in enumerate(self._processes):
+                if not process.is_alive():
+                    print(f"Worker for shard {shard} exited with code {process.exitcode}, restarting")
+                    self._spawn(shard)
+
+    def start(self):
+        for shard in range(self.shards):
+            self._spawn(shard)
+        self._task = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        for process in self._processes:
+            if process is not None and process.is_alive():
+                process.terminate()  # SIGTERM: the worker stops its scheduler and flushes its writes
+        loop = asyncio.get_running_loop()
+        for process in self._processes:
+            if process is not None:
+                await loop.run_in_executor(None, process.join, WORKER_STOP_TIMEOUT)
+                if process.is_alive():
+                    process.kill()
@@ -0,0 +1,97 @@
+import asyncio
+import multiprocessing
+import signal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import metrics
+from config import STAGE_THREADS, RENDER_PROCESSES, RENDER_QUEUE_LIMIT, IO_QUEUE_LIMIT
+
+# Executors for the blocking parts of a check, so the event loop only coordinates:
+#  - render: PNG encoding of contribution graphs, in worker processes (CPU-bound)
+#  - io: JSON decoding of full-year calendars and graph archiving, on a small thread pool
+#  - ai: MetaAI prompts, on a single thread of its own (one client, not thread-safe)
+# Each stage caps its backlog (queued + running). Callers beyond the cap wait for a
+# slot, and bot.check_users() defers new checks while render or io is full.
+# Executors, and with them the render processes, start on first use.
+
+
+# Render processes leave Ctrl+C to the bot, which shuts them down
+def _ignore_sigint():
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class Stage:
+    """
+    One named executor with a bounded backlog.
+    """
+
+    def __init__(self, name, make_executor, limit):
+        self.name = name
+        self.limit = limit
+        self.stats = {"run": 0, "waited": 0, "max_backlog": 0}
+        self._make_executor = make_executor
+        self._executor = None
+        self._slots = None  # Semaphore, created on the running loop
+        self._backlog = 0
+
+    def backlog(self):
+        return self._backlog
+
+    def saturated(self):
+        return self._backlog >= self.limit
+
+    # Run `fn(*args)` on the stage's executor; waits for a slot while the backlog is full
+    async def run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        if self._executor is None:
+            self._executor = self._make_executor()
+        if self._slots.locked():
+            self.stats["waited"] += 1
+        self._backlog += 1
+        self.stats["max_backlog"] = max(self.stats["max_backlog"], self._backlog)
+        try:
+            async with self._slots:
+                self.stats["run"] += 1
+                return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            self._backlog -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        self._slots = None
+
+
+_stages = {
+    "render": Stage("render", lambda: ProcessPoolExecutor(
+        max_workers=RENDER_PROCESSES,
+        mp_context=multiprocessing.get_context("spawn"),  # Like the shard workers: no inherited loop or threads
+        initializer=_ignore_sigint,
+    ), RENDER_QUEUE_LIMIT),
+    "io": Stage("io", lambda: ThreadPoolExecutor(STAGE_THREADS, thread_name_prefix="stage-io"), IO_QUEUE_LIMIT),
+    "ai": Stage("ai", lambda: ThreadPoolExecutor(1, thread_name_prefix="stage-ai"), 1),
+}
+
+
+async def run(stage, fn, *args):
+    return await _stages[stage].run(fn, *args)
+
+
+# True if any of the named stages is at its backlog limit
+def saturated(*stages):
+    return any(_stages[stage].saturated() for stage in stages)
+
+
+def stats():
+    return {name: dict(stage.stats, backlog=stage.backlog()) for name, stage in _stages.items()}
+
+
+def start():
+    for name, stage in _stages.items():
+        metrics.gauge(f"stage_backlog_{name}", f"'{name}' jobs queued or running", stage.backlog)
+
+
+def shutdown():
+    for stage in _stages.values():
+        stage.shutdown()
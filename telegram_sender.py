@@ -0,0 +1,335 @@
+import asyncio
+import heapq
+import itertools
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from telegram.error import BadRequest, NetworkError, RetryAfter, TimedOut
+import db
+import metrics
+from config import SEND_GLOBAL_RATE, SEND_CHAT_RATE, SEND_CONCURRENCY, PHOTO_CACHE_SIZE, PHOTO_CACHE_MAX_AGE
+
+PHOTO_PRUNE_JOB = "prune_photo_cache"
+PHOTO_PRUNE_INTERVAL = 86400  # Daily
+PHOTO_TOUCH_INTERVAL = 3600  # A cached file_id's last_used is written at most this often
+
+_file_ids = OrderedDict()  # graph digest -> (Telegram file_id, last_used as stored), least recently used first
+
+
+def _cache_file_id(digest, file_id, last_used):
+    _file_ids[digest] = (file_id, last_used)
+    _file_ids.move_to_end(digest)
+    if len(_file_ids) > PHOTO_CACHE_SIZE:
+        _file_ids.popitem(last=False)
+
+
+# One primary-key lookup per graph not in memory, off the event loop. Each use keeps the
+# row's last_used recent enough for prune_photo_cache to leave it alone.
+async def _file_id(digest):
+    now = time.time()
+    cached = _file_ids.get(digest)
+    if cached is None:
+        row = await db.aquery_one("SELECT file_id, last_used FROM photo_cache WHERE digest = ?", (digest,))
+        if row is None:
+            return None
+        cached = row
+    file_id, last_used = cached
+    if now - last_used > PHOTO_TOUCH_INTERVAL:
+        db.submit("UPDATE photo_cache SET last_used = ? WHERE digest = ?", (now, digest))
+        last_used = now
+    _cache_file_id(digest, file_id, last_used)
+    return file_id
+
+
+def _remember_file_id(digest, file_id):
+    now = time.time()
+    _cache_file_id(digest, file_id, now)
+    db.submit("INSERT OR REPLACE INTO photo_cache (digest, file_id, last_used) VALUES (?, ?, ?)", (digest, file_id, now))
+
+
+def _forget_file_id(digest):
+    _file_ids.pop(digest, None)
+    db.submit("DELETE FROM photo_cache WHERE digest = ?", (digest,))
+
+
+# Most graphs change daily, so each day adds a digest per active user; drop the ones not sent lately
+async def prune_photo_cache(max_age=PHOTO_CACHE_MAX_AGE):
+    result = await db.write("DELETE FROM photo_cache WHERE last_used < ?", (time.time() - max_age,))
+    if result.rowcount:
+        print(f"Pruned {result.rowcount} cached photo file_id(s)")
+
+
+# Send a rendered graph, reusing Telegram's file_id when the same image was uploaded before
+async def send_graph(bot, chat_id, graph):
+    file_id = await _file_id(graph.digest)
+    if file_id:
+        try:
+            return await bot.send_photo(chat_id=chat_id, photo=file_id)
+        except BadRequest as e:
+            print(f"Cached file_id for graph {graph.digest} rejected, uploading again: {e}")
+            _forget_file_id(graph.digest)
+
+    message = await bot.send_photo(chat_id=chat_id, photo=graph.png)
+    if message and message.photo:
+        _remember_file_id(graph.digest, message.photo[-1].file_id)  # Largest size
+    return message
+
+
+# Outbound queue priorities (lower goes first)
+PRIORITY_URGENT = 0  # Harsh end-of-day warnings
+PRIORITY_NORMAL = 1  # Regular text
+PRIORITY_GRAPH = 2  # Contribution graphs
+
+MAX_MESSAGE_LENGTH = 4096  # Telegram's limit; merged texts stay under it
+MAX_SEND_ATTEMPTS = 3
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until a token is available (0 if one is available now)
+    def delay(self, now):
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    # Block the bucket until `until` (used for RetryAfter)
+    def pause(self, until):
+        self.blocked_until = max(self.blocked_until, until)
+
+    def idle(self, now):
+        self._refill(now)
+        return now >= self.blocked_until and self.tokens >= self.capacity
+
+
+@dataclass(order=True)
+class OutboundMessage:
+    priority: int
+    seq: int
+    chat_id: int = field(compare=False)
+    text: str = field(default=None, compare=False)
+    graph: object = field(default=None, compare=False)
+    attempts: int = field(default=0, compare=False)
+
+
+class SendQueue:
+    """
+    Outbound Telegram queue with a global and a per-chat token bucket.
+
+    Messages go out by priority; consecutive texts for the same chat are
+    merged into one message, and RetryAfter pauses the chat and retries.
+    """
+
+    def __init__(self, bot, global_rate=SEND_GLOBAL_RATE, chat_rate=SEND_CHAT_RATE, concurrency=SEND_CONCURRENCY):
+        self.bot = bot
+        self.chat_rate = chat_rate
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chat_buckets = {}
+        self._pending = {}  # chat_id -> heap of OutboundMessage
+        self._ready = []  # (priority, seq, chat_id) for chats with pending messages and nothing in flight
+        self._waiting = []  # (ready_at, chat_id) for chats held back by their bucket
+        self._in_flight = set()
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._limit = None
+        self._concurrency = concurrency
+        self._task = None
+        self._sends = set()  # Send tasks in flight, awaited by stop()
+        self.stats = {"queued": 0, "sent": 0, "merged": 0, "retried": 0, "dropped": 0, "saved": 0}
+        self.started_at = time.monotonic()
+
+    def enqueue(self, chat_id, text=None, graph=None, priority=PRIORITY_NORMAL):
+        message = OutboundMessage(priority, next(self._seq), chat_id, text, graph)
+        self._push(message)
+        self.stats["queued"] += 1
+
+    def _push(self, message):
+        chat_id = message.chat_id
+        queue = self._pending.setdefault(chat_id, [])
+        was_empty = not queue
+        heapq.heappush(queue, message)
+        if chat_id in self._in_flight:
+            return
+        if was_empty or queue[0] is message:
+            heapq.heappush(self._ready, (queue[0].priority, queue[0].seq, chat_id))
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def depth(self):
+        return sum(len(queue) for queue in self._pending.values())
+
+    # Sent messages per second since the queue started, and the share of messages dropped
+    def throughput(self):
+        elapsed = max(time.monotonic() - self.started_at, 1e-9)
+        return self.stats["sent"] / elapsed
+
+    def drop_rate(self):
+        finished = self.stats["sent"] + self.stats["merged"] + self.stats["dropped"]
+        return self.stats["dropped"] / finished if finished else 0.0
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(self.chat_rate, 1)
+        return bucket
+
+    # Take the head message for a chat, merging the texts that follow it
+    def _take(self, chat_id):
+        queue = self._pending[chat_id]
+        message = heapq.heappop(queue)
+        if message.text is not None and message.graph is None:
+            while queue and queue[0].graph is None and queue[0].text is not None \
+                    and len(message.text) + len(queue[0].text) + 2 <= MAX_MESSAGE_LENGTH:
+                message.text += "\n\n" + heapq.heappop(queue).text
+                self.stats["merged"] += 1
+        if not queue:
+            del self._pending[chat_id]
+        return message
+
+    # Whatever remains for a chat becomes ready again once its send finishes
+    def _release(self, chat_id):
+        self._in_flight.discard(chat_id)
+        queue = self._pending.get(chat_id)
+        if queue:
+            heapq.heappush(self._ready, (queue[0].priority, queue[0].seq, chat_id))
+        self._wakeup.set()
+
+    async def _send(self, message):
+        try:
+            with metrics.timed("telegram_send"):
+                if message.text is not None:
+                    await self.bot.send_message(chat_id=message.chat_id, text=message.text)
+                if message.graph is not None:
+                    await send_graph(self.bot, message.chat_id, message.graph)
+            self.stats["sent"] += 1
+        except RetryAfter as e:
+            metrics.inc("rate_limit_hits_total", source="telegram")
+            self._retry(message, e.retry_after)
+        except BadRequest as e:
+            self._drop(message, e)
+        except (TimedOut, NetworkError):
+            self._retry(message, 1.0)
+        except Exception as e:
+            self._drop(message, e)
+        finally:
+            self._limit.release()
+            self._release(message.chat_id)
+
+    def _retry(self, message, delay):
+        message.attempts += 1
+        if message.attempts >= MAX_SEND_ATTEMPTS:
+            self._drop(message, f"gave up after {message.attempts} attempts")
+            return
+        self.stats["retried"] += 1
+        self._chat_bucket(message.chat_id).pause(time.monotonic() + delay)
+        heapq.heappush(self._pending.setdefault(message.chat_id, []), message)
+
+    def _drop(self, message, reason):
+        self.stats["dropped"] += 1
+        metrics.inc("errors_total", stage="telegram_send")
+        print(f"Error sending Telegram notification to {message.chat_id}: {reason}")
+
+    def _prune_buckets(self, now):
+        for chat_id in [chat_id for chat_id, bucket in self._chat_buckets.items()
+                        if chat_id not in self._pending and chat_id not in self._in_flight and bucket.idle(now)]:
+            del self._chat_buckets[chat_id]
+
+    async def _run(self):
+        last_prune = time.monotonic()
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            while self._waiting and self._waiting[0][0] <= now:
+                _, chat_id = heapq.heappop(self._waiting)
+                self._release(chat_id)
+            if now - last_prune > 60:
+                self._prune_buckets(now)
+                last_prune = now
+
+            if not self._ready:
+                timeout = self._waiting[0][0] - now if self._waiting else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            _, seq, chat_id = heapq.heappop(self._ready)
+            queue = self._pending.get(chat_id)
+            if chat_id in self._in_flight or not queue or queue[0].seq != seq:
+                continue  # Stale entry
+
+            chat_delay = self._chat_bucket(chat_id).delay(now)
+            if chat_delay > 0:
+                self._in_flight.add(chat_id)  # Parked until its bucket refills
+                heapq.heappush(self._waiting, (now + chat_delay, chat_id))
+                continue
+
+            global_delay = self._global.delay(now)
+            if global_delay > 0:
+                heapq.heappush(self._ready, (queue[0].priority, seq, chat_id))
+                await asyncio.sleep(global_delay)
+                continue
+
+            await self._limit.acquire()
+            now = time.monotonic()
+            self._global.take(now)
+            self._chat_bucket(chat_id).take(now)
+            self._in_flight.add(chat_id)
+            task = asyncio.create_task(self._send(self._take(chat_id)))
+            self._sends.add(task)
+            task.add_done_callback(self._sends.discard)
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._limit = asyncio.Semaphore(self._concurrency)
+        self._task = asyncio.create_task(self._run())
+        metrics.gauge("send_queue_depth", "Outbound Telegram messages waiting", self.depth)
+
+    # Stop dispatching, giving queued messages up to `timeout` seconds to go out. Sends already
+    # started are waited for; what's still queued after that is saved to the `outbox` table,
+    # which the next start drains back into the queue (sharding.drain_outbox).
+    async def stop(self, timeout=5):
+        deadline = time.monotonic() + timeout
+        while (self._pending or self._in_flight) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.gather(*self._sends, return_exceptions=True)
+        await self._save_pending()
+
+    async def _save_pending(self):
+        messages = sorted(message for queue in self._pending.values() for message in queue)
+        self._pending.clear()
+        if not messages:
+            return
+        now = time.time()
+        try:
+            await db.write(
+                "INSERT INTO outbox (chat_id, text, graph, graph_digest, priority, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                [(message.chat_id, message.text, message.graph.png if message.graph else None,
+                  message.graph.digest if message.graph else None, message.priority, now) for message in messages],
+                many=True,
+            )
+            self.stats["saved"] += len(messages)
+            print(f"Saved {len(messages)} unsent message(s) to the outbox")
+        except Exception as e:
+            self.stats["dropped"] += len(messages)
+            metrics.inc("errors_total", stage="telegram_send")
+            print(f"Error saving {len(messages)} unsent message(s): {e}")
@@ -1,13 +1,17 @@
-from meta_ai_api import MetaAI
 import requests
-from datetime import datetime
 from threading import Thread
-from PIL import Image, ImageDraw, ImageTk
-import tkinter as tk
 import time
+from datetime import date
 import os
-import sqlite3
+import random
 import sys
+import asyncio
+import db
+import jobs
+from github_events import check_today_pushes
+from packed_calendar import PackedCalendar
+from pruning import prune_notifications, PRUNE_JOB
+from sampler import FALLBACK_BOUNDS_SQL, FALLBACK_PICK_SQL, fallback_picks
 
 # Constants
 GITHUB_USERNAME = ""  # Replace with your GitHub username
@@ -16,14 +20,14 @@ BOT_TOKEN = ""  # Replace with your bot token
 CHAT_ID = ""  # Replace with your chat ID
 
 IMAGE_PATH = os.path.join(os.getcwd(), "Images")
-DATABASE_PATH = os.path.join(os.getcwd(), "notifications.db")
+# The database lives at DATABASE_PATH from config.py and is shared through db.py
 
 # Ensure necessary directories exist
 os.makedirs(IMAGE_PATH, exist_ok=True)
 
 # Database initialization
 def init_database():
-    conn = sqlite3.connect(DATABASE_PATH)
+    conn = db.get_connection()
     cursor = conn.cursor()
     cursor.execute("""
         CREATE TABLE IF NOT EXISTS notifications (
@@ -33,8 +37,37 @@ def init_database():
             rating INTEGER DEFAULT 0
         )
     """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_notifications_category_rating ON notifications (category, rating)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deliveries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            chat_id INTEGER NOT NULL,
+            notification_id INTEGER NOT NULL,
+            sent_at REAL NOT NULL,
+            day TEXT NOT NULL,
+            count_at_send INTEGER NOT NULL,
+            status INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_deliveries_notification ON deliveries (notification_id, status)")
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            name TEXT PRIMARY KEY,
+            next_run_at REAL NOT NULL
+        )
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS event_polls (
+            username TEXT PRIMARY KEY,
+            etag TEXT,
+            poll_interval INTEGER NOT NULL,
+            last_event_id INTEGER NOT NULL,
+            day TEXT NOT NULL,
+            push_count INTEGER NOT NULL,
+            polled_at REAL NOT NULL
+        )
+    """)
     conn.commit()
-    conn.close()
 
 
 def generate_notification(category):
@@ -48,6 +81,7 @@ def generate_notification(category):
         The generated notification message.
     """
     try:
+        from meta_ai_api import MetaAI  # Imported on first use; slow to load
         ai = MetaAI()
         prompt = f"Generate a {category} notification for a GitHub user to encourage them to code. No more than 10 words. using {GITHUB_USERNAME} for username.'"
         response = ai.prompt(message=prompt)
@@ -84,60 +118,39 @@ def generate_notification(category):
 #         return None
 
 
-# Fetch notification by category
+# Fetch notification by category, favouring higher ratings (index seeks only; see sampler.fallback_picks)
 def get_notification(category):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT id, message FROM notifications WHERE category = ? ORDER BY RANDOM() LIMIT 1", (category,))
-    row = cursor.fetchone()
-    conn.close()
-    return row
+    bounds = db.query_one(FALLBACK_BOUNDS_SQL, (category, category))
+    for params in fallback_picks(category, bounds):
+        row = db.query_one(FALLBACK_PICK_SQL, params)
+        if row:
+            return row
+    return None
 
 # Update notification rating
 def update_notification_rating(notification_id, increment):
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("UPDATE notifications SET rating = rating + ? WHERE id = ?", (increment, notification_id))
-    conn.commit()
-    conn.close()
+    db.execute("UPDATE notifications SET rating = rating + ? WHERE id = ?", (increment, notification_id))
 
-# Cleanup notifications every 3 days
+# Cleanup notifications: drop the least effective 15% of each category, in small chunks
 def cleanup_notifications():
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
-    cursor.execute("""
-        DELETE FROM notifications
-        WHERE id IN (
-            SELECT id FROM notifications ORDER BY rating ASC LIMIT (SELECT COUNT(*) * 15 / 100 FROM notifications)
-        )
-    """)
-    conn.commit()
-    conn.close()
+    asyncio.run(prune_notifications())
 
-# Schedule notification cleanup every 3 days
+# Schedule notification cleanup every 3 days; the next run time is kept in the database
 def schedule_cleanup(interval_days=3):
     def cleanup_task():
         while True:
+            time.sleep(jobs.seconds_until_due(PRUNE_JOB))
             print("Performing cleanup of old notifications...")
             cleanup_notifications()
-            time.sleep(interval_days * 86400)  # Wait for the interval (in seconds)
+            jobs.mark_run(PRUNE_JOB, interval_days * 86400)
 
     Thread(target=cleanup_task, daemon=True).start()
 
-# Check today's contribution from GitHub
+# Check today's contribution from GitHub (conditional requests; unchanged event pages cost nothing)
 def check_today_contribution(username, token):
-    url = f"https://api.github.com/users/{username}/events/public"
-    headers = {"Authorization": f"token {token}"}
-    response = requests.get(url, headers=headers)
+    return check_today_pushes(username, token)
 
-    if response.status_code == 200:
-        today_date = datetime.now().strftime('%Y-%m-%d')
-        events = response.json()
-        commit_count = sum(1 for event in events if event['type'] == 'PushEvent' and event['created_at'][:10] == today_date)
-        return commit_count > 0, commit_count
-    return False, 0
-
-# Fetch commit activity for the contribution graph
+# Fetch commit activity as a PackedCalendar (counts, streaks and graph levels), or None
 def fetch_commit_activity(username, token):
     url = f"https://api.github.com/graphql"
     headers = {"Authorization": f"Bearer {token}"}
@@ -147,6 +160,7 @@ def fetch_commit_activity(username, token):
           contributionCalendar {
             weeks {
               contributionDays {
+                date
                 contributionCount
               }
             }
@@ -158,16 +172,17 @@ def fetch_commit_activity(username, token):
     if response.status_code == 200:
         data = response.json()
         weeks = data['data']['viewer']['contributionsCollection']['contributionCalendar']['weeks']
-        activity = [[day['contributionCount'] for day in week['contributionDays']] for week in weeks]
-        return activity
-    return []
+        days = [(day['date'], day['contributionCount']) for week in weeks for day in week['contributionDays']]
+        return PackedCalendar.empty(date.today()).merge(days)
+    return None
 
 # Create a contribution graph image
-def create_contribution_graph(activity_data, output_file="contribution_graph.png"):
-    if not activity_data:
+def create_contribution_graph(calendar, output_file="contribution_graph.png"):
+    if calendar is None:
         print("No activity data available to create the graph.")
         return
 
+    from PIL import Image, ImageDraw
     box_size, padding = 20, 5
     cols, rows = 53, 7
     img_width, img_height = cols * (box_size + padding) + padding, rows * (box_size + padding) + padding
@@ -175,13 +190,13 @@ def create_contribution_graph(activity_data, output_file="contribution_graph.png
     draw = ImageDraw.Draw(image)
 
     colors = ["#ebedf0", "#c6e48b", "#7bc96f", "#239a3b", "#196127"]
-    daily_contributions = [day for week in activity_data for day in week]
+    levels = calendar.levels()[:calendar.length]  # 1 + contribution level per day
 
-    for i, count in enumerate(daily_contributions):
+    for i, level in enumerate(levels):
         week, day = divmod(i, 7)
         x = padding + week * (box_size + padding)
         y = padding + day * (box_size + padding)
-        color = colors[min(count, len(colors) - 1)]
+        color = colors[level - 1]
         draw.rectangle([x, y, x + box_size, y + box_size], fill=color)
 
     output_path = os.path.join(IMAGE_PATH, output_file)
@@ -206,7 +221,8 @@ def send_telegram_notification(message, image_path=None):
 # Monitor contributions and send notifications
 def monitor_contributions(username):
     categories = ["gentle", "bit_harsh", "harshest"]
-    streak = 0
+    calendar = fetch_commit_activity(username, GITHUB_TOKEN)
+    streak = calendar.current_streak if calendar else 0
 
     for category in categories:
         contributed, count = check_today_contribution(username, GITHUB_TOKEN)
@@ -251,6 +267,10 @@ def display_widget(image_path, username, token):
     """
     schedule_reminders(username, token, interval=3600)
 
+    # The GUI stack is only needed here
+    import tkinter as tk
+    from PIL import Image, ImageTk
+
     # Create the GUI
     root = tk.Tk()
     root.title("GitHub Contribution Graph")
@@ -274,22 +294,20 @@ def display_widget(image_path, username, token):
 
 def populate_notifications():
     categories = ["gentle", "bit_harsh", "harshest"]
-    conn = sqlite3.connect(DATABASE_PATH)
-    cursor = conn.cursor()
+    rows = []
     
     for category in categories:
         for _ in range(2):  # Generate 2 messages for each category
             message = generate_notification(category)
-            cursor.execute("INSERT INTO notifications (category, message) VALUES (?, ?)", (category, message))
+            rows.append((category, message))
     
-    conn.commit()
-    conn.close()
+    db.execute("INSERT INTO notifications (category, message) VALUES (?, ?)", rows, many=True)
 
 if __name__ == "__main__":
     init_database()
     populate_notifications()  # Populate notifications with AI-generated messages
     schedule_cleanup()  # Schedule cleanup of old notifications
-    activity_data = fetch_commit_activity(GITHUB_USERNAME, GITHUB_TOKEN)  # Fetch initial commit activity
-    graph_path = create_contribution_graph(activity_data)  # Create the contribution graph
+    calendar = fetch_commit_activity(GITHUB_USERNAME, GITHUB_TOKEN)  # Fetch initial commit activity
+    graph_path = create_contribution_graph(calendar)  # Create the contribution graph
     Thread(target=monitor_contributions, args=(GITHUB_USERNAME,), daemon=True).start()  # Start monitoring contributions
     display_widget(graph_path, GITHUB_USERNAME, GITHUB_TOKEN)  # Display the contribution graph in a GUI